@@ -0,0 +1,3 @@
+"""
+Maximum conducted powers of lteresults_cal.txt logs, see conductedmax.py.
+"""
@@ -1,123 +1,125 @@
-import pandas as pd
-from docx.shared import Pt
-from docx import Document
+import os
+import sys
+if __name__ == "__main__" and not __package__:     # started as python conductedmax.py, report_table.py is in the repository root
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 """Reads csv file with pandas and gets the maximum power(dBm) per band and per channel type, then outputs a
-word-document table listing results. Usable with lteresults_cal.txt only"""
+word-document table listing results. Usable with lteresults_cal.txt only. Files are read in chunks, so
+very large or several concatenated logs can be handled: python conductedmax.py log1.txt log2.txt
+pandas and python-docx are imported by the functions that use them, so importing this module is fast"""
 
 doc_name = "conducted maximums.docx"
-text_file = "lteresults_cal.txt"
-df = pd.read_csv(text_file, sep="\t", engine='python')
+text_files = ["lteresults_cal.txt"]    # default, several files can be given as arguments, results are merged
+chunk_size = 200000     # rows read at a time, memory use does not grow with file size
 
 column_names = ["Band", "BW", "RBs", "RB Start", "Modulation", "ChanType", "Channel", "Frequency", "Power"]
+# only Band and Power are used as numbers, other values are listed in the table as they are written in the file
+column_types = {name: str for name in column_names}
+column_types.update(Band="int64", Power="float64")
 
-for index, name in enumerate(column_names): # setting column names in dataframe to correspond to 'column_names' list
-    df.columns.values[index] = name
-
-band_list = df["Band"].unique()
-bands_and_values = {}   # to hold {band,a list of lists(containing BW, RBs, RB Start etc.)}
-
-for i in range(len(df.index)): # go through each row, create a dictionary with a unique band number and dict value being a list of values
-    band_num = df.iloc[i]['Band']
-    if band_num in band_list:
-        values = [df.iloc[i]['BW'], df.iloc[i]['RBs'], df.iloc[i]['RB Start'], df.iloc[i]['Modulation'],
-                  df.iloc[i]['ChanType'], df.iloc[i]['Channel'], df.iloc[i]['Power']]
-        if band_num in bands_and_values:
-            bands_and_values[int(band_num)].append(values)
-        else:
-            bands_and_values[int(band_num)] = [values]
-
-
-max_powers = {}  # dictionary to hold maximum power for each band/channeltype
-for band in bands_and_values.keys():    # loop through each band, put low,mid and high channel powers in their own lists
-    low_power_list = []
-    mid_power_list = []
-    high_power_list = []
-    for value in bands_and_values[band]:
-        if value[4] in ["LOW CH", "Low CH"]:
-            low_power_list.append(value)
-        elif value[4] in ["MID CH", "Mid CH"]:
-            mid_power_list.append(value)
-        elif value[4] in ["HIGH CH", "High CH"]:
-            high_power_list.append(value)
-        else:
-            print(f"ERROR: unexpected channel type {value[4]}")
-            exit()
-    # finds maximum value of each list
-    max_low = max(map(lambda x: x[6], low_power_list))
-    max_mid = max(map(lambda x: x[6], mid_power_list))
-    max_high = max(map(lambda x: x[6], high_power_list))
-
-    # go through low, mid, high channels for each band and make a dict with {band, (max power + other values)}
-    for sublist in low_power_list:
-        for power in sublist:
-            if power == max_low:
-                if band in max_powers:
-                    max_powers[band].append(sublist)
-                else:
-                    max_powers[band] = [sublist]
-    for sublist in mid_power_list:
-        for power in sublist:
-            if power == max_mid:
-                if band in max_powers:
-                    max_powers[band].append(sublist)
-                else:
-                    max_powers[band] = [sublist]
-    for sublist in high_power_list:
-        for power in sublist:
-            if power == max_high:
-                if band in max_powers:
-                    max_powers[band].append(sublist)
-                else:
-                    max_powers[band] = [sublist]
-
-# get total value count in dictionary, to be used in word table for rows
-rows = 0
-for key, value in max_powers.items():
-    for subvalue in value:
-        rows += 1
-
-        
-"""Creating a word-document with a table containing all the maximum conducted power values. Lists
-maximums per band and per channel type
-"""
-document = Document()
-table = document.add_table(rows=rows+1, cols=8)
-table.allow_autofit = False
-table.style = document.styles['Table Grid']
-header_cells = table.rows[0].cells
-word_table_headers = ['LTE Band', 'Channel Type', 'Channel #', 'Modulation',
-                        'BW', 'RB Size', 'RB Start', 'Power(dBm)']
-
-for num, header in enumerate(word_table_headers):   # fill header cells in table with values in 'word_table_headers' list
-    header_cells[num].text = header 
-
-row_num = 0
-band_index = 1
-# looping through dictionary and filling word table rows with values
-for key, value in max_powers.items():
-    print(f"Band {key}\n----------------------\n")
-    for subvalue in value:  # value = channel type, channel number, modulation etc.
-        this_row = table.rows[row_num + 1].cells
-        this_row[0].text = str(key)  # band
-        this_row[1].text = str(subvalue[4])  # channeltype
-        this_row[2].text = str(subvalue[5])  # channelnumber
-        this_row[3].text = str(subvalue[3])  # Modulation
-        this_row[4].text = str(subvalue[0])  # BW
-        this_row[5].text = str(subvalue[1])  # RB Size
-        this_row[6].text = str(subvalue[2])  # RB Start
-        this_row[7].text = str((round(float(subvalue[6]), 2)))  # Power
-        for cell in this_row:
-            paragraphs = cell.paragraphs
-            for paragraph in paragraphs:
-                for run in paragraph.runs:
-                    font = run.font
-                    font.size = Pt(10)
-                    if band_index % 2 == 0:  # bold every 2nd band in table
-                        font.bold = True
-        print(f"{subvalue[4]}: {this_row[7].text} dBm")
-        row_num += 1
-    print("\n")
-    band_index += 1
-document.save(doc_name)
+channel_types = {"LOW CH": "LOW CH", "Low CH": "LOW CH", "MID CH": "MID CH", "Mid CH": "MID CH",
+                 "HIGH CH": "HIGH CH", "High CH": "HIGH CH"}   # accepted channel type spellings
+channel_order = ["LOW CH", "MID CH", "HIGH CH"]    # order of channel types within a band in the table
+value_columns = ["BW", "RBs", "RB Start", "Modulation", "ChanType", "Channel", "Power"]
 
+def read_chunks(file_name):
+    """Reads a lteresults_cal.txt file in chunks of chunk_size rows with the C parser, header row is skipped"""
+
+    import pandas as pd
+    return pd.read_csv(file_name, sep="\t", header=0, names=column_names, usecols=range(len(column_names)),
+                       dtype=column_types, chunksize=chunk_size)
+
+def update_max_powers(df, running_max, band_order):
+    """Finds the maximum power per band and per channel type of one chunk with one groupby and merges it to
+    running_max {(band, channel type): [max power, rows reaching it]}. On ties all rows are kept in file order.
+    New bands are added to band_order in order of first appearance. Raises ValueError on unknown channel types"""
+
+    channel = df["ChanType"].map(channel_types)
+    unexpected = df["ChanType"][channel.isna()]
+    if len(unexpected):
+        raise ValueError(f"unexpected channel type {unexpected.iloc[0]}")
+    for band in df["Band"].unique():
+        if band not in band_order:
+            band_order.append(band)
+    group_max = df["Power"].groupby([df["Band"], channel]).transform("max")
+    maximums = df[df["Power"] == group_max]
+    for group, rows in maximums.groupby([maximums["Band"], channel[maximums.index]], sort=False):
+        power = rows["Power"].iloc[0]
+        current = running_max.get(group)
+        if current is None or power > current[0]:
+            running_max[group] = [power, rows[value_columns].values.tolist()]
+        elif power == current[0]:
+            current[1].extend(rows[value_columns].values.tolist())
+
+def find_max_powers(file_names):
+    """Goes through all files chunk by chunk and returns {band: [rows with maximum power]}, with bands in order
+    of first appearance and rows ordered by channel type (low, mid, high) and then file order.
+    Files can also be open text files (e.g. io.StringIO), rows are lists of value_columns"""
+
+    running_max = {}
+    band_order = []
+    for file_name in file_names:
+        with read_chunks(file_name) as chunks:
+            for df in chunks:
+                update_max_powers(df, running_max, band_order)
+    max_powers = {}
+    for band in band_order:
+        for channel in channel_order:
+            if (band, channel) in running_max:
+                max_powers.setdefault(int(band), []).extend(running_max[(band, channel)][1])
+    return max_powers
+
+def band_rows(band, rows):
+    """Word table rows of one band: band, channeltype, channelnumber, modulation, BW, RB Size, RB Start, power"""
+
+    table_rows = []
+    for subvalue in rows:  # subvalue = BW, RB Size, RB Start, modulation, channel type, channel number, power
+        power = str((round(float(subvalue[6]), 2)))
+        table_rows.append([band, subvalue[4], subvalue[5], subvalue[3], subvalue[0], subvalue[1], subvalue[2], power])
+    return table_rows
+
+def new_doc(max_powers):
+    """Returns a word-document with a table containing all the maximum conducted power values. Lists
+    maximums per band and per channel type
+    """
+
+    from docx import Document
+    import report_table
+    document = Document()
+    table = document.add_table(rows=1, cols=8)
+    table.allow_autofit = False
+    table.style = document.styles['Table Grid']
+    header_cells = table.rows[0].cells
+    word_table_headers = ['LTE Band', 'Channel Type', 'Channel #', 'Modulation',
+                            'BW', 'RB Size', 'RB Start', 'Power(dBm)']
+
+    for num, header in enumerate(word_table_headers):   # fill header cells in table with values in 'word_table_headers' list
+        header_cells[num].text = header 
+
+    text_style = report_table.paragraph_style(document, "Conducted Table Text", 10)
+    bold_style = report_table.paragraph_style(document, "Conducted Table Bold", 10, bold=True)
+    # looping through dictionary and adding the rows of each band to word table
+    for band_index, (key, value) in enumerate(max_powers.items(), 1):
+        report_table.add_rows(table, band_rows(key, value), bold_style if band_index % 2 == 0 else text_style)  # bold every 2nd band in table
+    return document
+
+def write_doc(max_powers):
+    """Prints the maximums of each band and saves them as a word-document table in doc_name"""
+
+    for key, value in max_powers.items():
+        print(f"Band {key}\n----------------------\n")
+        for row in band_rows(key, value):
+            print(f"{row[1]}: {row[7]} dBm")
+        print("\n")
+    new_doc(max_powers).save(doc_name)
+
+def main(file_names=None):
+    try:
+        max_powers = find_max_powers(file_names or text_files)  # dictionary to hold maximum power for each band/channeltype
+    except ValueError as error:
+        print(f"ERROR: {error}")
+        sys.exit(1)
+    write_doc(max_powers)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
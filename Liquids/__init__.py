@@ -0,0 +1,4 @@
+"""
+Liquid parameter reporting: liquids.py adds the Search sheet to the liquid measurement workbooks and their
+rows to Report.docx, the other modules read the frequency table, manifests and Liquid sheets.
+"""
@@ -0,0 +1,120 @@
+import hashlib
+import json
+import math
+import os
+import numpy as np
+import atomic_files
+
+"""
+Parsed "frequency table.xlsx": {column name: [frequencies]} with the empty cells left out. Parsing the workbook
+with pandas is the slow part of starting liquids.py, so the parsed table is kept in two places:
+    in memory for the rest of the process, checked against the size and modification time of the file
+    in cache_dir as a raw float64 file of all frequencies and a .json file with the column names, their
+    lengths and the size, modification time and SHA-256 hash of the workbook they came from
+A cache entry whose size or modification time no longer match is still used if the hash of the workbook is
+the same (e.g. the file was saved again without changes), otherwise the workbook is parsed again.
+"""
+
+DTYPE = np.float64
+SHEET_NAME = 'Sheet1'
+
+_tables = {}    # {absolute path, ((size, modification time), table)}
+
+
+def read_table(workbook):
+    """Parses a frequency table workbook (file name or open binary file). Returns {column name: [frequencies]}
+    in the column order of the sheet, frequencies of columns with only whole numbers are ints like in pandas.
+    Raises ValueError if a column has values that are not numbers"""
+
+    import pandas as pd
+    df = pd.read_excel(workbook, sheet_name=SHEET_NAME)
+    table = {}
+    errors = []
+    for column in df.columns:
+        if pd.api.types.is_integer_dtype(df[column]):
+            table[str(column)] = df[column].to_list()
+            continue
+        try:
+            values = [float(value) for value in df[column].to_list()]
+        except (TypeError, ValueError):
+            errors.append(str(column))
+            continue
+        table[str(column)] = [value for value in values if not math.isnan(value)]
+    if errors:
+        raise ValueError(f"columns {', '.join(errors)} have values that are not frequencies")
+    return table
+
+
+def _entry_paths(cache_dir, source):
+    key = hashlib.sha256(source.encode("utf-8")).hexdigest()    # one entry per workbook path
+    return os.path.join(cache_dir, key + ".f8"), os.path.join(cache_dir, key + ".json")
+
+
+def _load_entry(source, state, cache_dir):
+    """Table of the cache entry of source, or None if there is no entry or the workbook has changed"""
+
+    data_path, header_path = _entry_paths(cache_dir, source)
+    try:
+        with open(header_path) as meta:
+            header = json.load(meta)
+        if [header['size'], header['mtime_ns']] != list(state):
+            if header['hash'] != atomic_files.file_hash(source):
+                return None
+            header['size'], header['mtime_ns'] = state
+            atomic_files.write_json(header, header_path)
+        values = np.fromfile(data_path, dtype=DTYPE)
+    except (OSError, ValueError, KeyError):
+        return None
+    if len(values) != sum(header['lengths']):
+        return None
+    table = {}
+    start = 0
+    integer_columns = set(header['integer_columns'])
+    for column, length in zip(header['columns'], header['lengths']):
+        table[column] = values[start:start + length].tolist()
+        if column in integer_columns:
+            table[column] = [int(value) for value in table[column]]
+        start += length
+    return table
+
+
+def _store_entry(source, state, digest, table, cache_dir):
+    """Writes table to the cache, the .json file last so an entry without it is never read"""
+
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, header_path = _entry_paths(cache_dir, source)
+    values = np.array([value for values in table.values() for value in values], dtype=DTYPE)
+    atomic_files.replace_atomic(data_path, values.tofile)
+    header = {'source': source, 'size': state[0], 'mtime_ns': state[1], 'hash': digest,
+              'columns': list(table), 'lengths': [len(values) for values in table.values()],
+              'integer_columns': [column for column, values in table.items()
+                                  if all(isinstance(value, int) for value in values)]}
+    atomic_files.write_json(header, header_path)
+
+
+def load_table(file_name, cache_dir=None):
+    """Returns the table of a frequency table workbook like read_table, from memory or cache_dir when the
+    workbook has not changed. The same dict is returned to every caller, it must not be modified"""
+
+    source = os.path.abspath(file_name)
+    stat = os.stat(source)
+    state = (stat.st_size, stat.st_mtime_ns)
+    if source in _tables and _tables[source][0] == state:
+        return _tables[source][1]
+    table = _load_entry(source, state, cache_dir) if cache_dir is not None else None
+    if table is None:
+        digest = atomic_files.file_hash(source)  # hashed before parsing, a change during parsing makes the entry stale
+        table = read_table(source)
+        if cache_dir is not None:
+            try:
+                _store_entry(source, state, digest, table, cache_dir)
+            except OSError as error:    # the table is still used, it is parsed again next time
+                print(f"Could not cache {file_name}: {error}")
+    _tables[source] = (state, table)
+    return table
+
+
+def unknown_columns(table, columns):
+    """Columns that are not in table, in the order given"""
+
+    return [column for column in columns if column not in table]
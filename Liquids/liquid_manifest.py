@@ -0,0 +1,58 @@
+import csv
+import json
+import os
+
+"""
+Manifest for running liquids.py without anyone typing in the band columns. The manifest maps each liquid
+excel file in the folder to the columns of "frequency table.xlsx" that would otherwise be entered for it:
+    JSON: {"liquid1.xlsx": ["B1", "B5"], "liquid2.xlsx": "B7"}   (a string is split at commas like typed input)
+    CSV:  one excel file per row followed by its columns, e.g. liquid1.xlsx,B1,B5   (rows starting with # are skipped)
+"""
+
+
+def parse_columns(columns):
+    """Column names of a typed input or manifest value: "B1, B5" or ["B1", "B5"] -> ["B1", "B5"]"""
+
+    if isinstance(columns, str):
+        columns = columns.split(",")
+    return [str(column).strip() for column in columns if str(column).strip()]
+
+
+def read_manifest(file_name):
+    """Returns {excel file name: [column names]} in the order of the manifest. Raises ValueError if the
+    manifest is not a JSON or CSV file or lists an excel file twice"""
+
+    extension = os.path.splitext(file_name)[1].lower()
+    if extension == ".json":
+        with open(file_name, encoding="utf-8") as manifest_file:
+            entries = list(json.load(manifest_file).items())
+    elif extension == ".csv":
+        with open(file_name, newline="", encoding="utf-8") as manifest_file:
+            entries = [(row[0].strip(), row[1:]) for row in csv.reader(manifest_file)
+                       if row and row[0].strip() and not row[0].startswith("#")]
+    else:
+        raise ValueError(f"{file_name}: manifest has to be a .json or .csv file")
+    manifest = {}
+    for excel_name, columns in entries:
+        if excel_name in manifest:
+            raise ValueError(f"{file_name}: {excel_name} is listed twice")
+        manifest[excel_name] = parse_columns(columns)
+    return manifest
+
+
+def validate(manifest, column_names, excel_names):
+    """Checks every manifest entry in one pass against the sets of frequency table columns and excel files
+    in the folder. Returns a list of error messages, empty if the manifest is valid"""
+
+    column_names = set(column_names)
+    excel_names = set(excel_names)
+    errors = []
+    for excel_name, columns in manifest.items():
+        if excel_name not in excel_names:
+            errors.append(f"{excel_name}: file not found")
+        if not columns:
+            errors.append(f"{excel_name}: no columns given")
+        unknown = [column for column in columns if column not in column_names]
+        if unknown:
+            errors.append(f"{excel_name}: unknown columns {', '.join(unknown)}")
+    return errors
@@ -0,0 +1,104 @@
+import numpy as np
+
+"""
+Computes the values of the "Search" sheet (e' and conductivity targets, measured values and deltas at each
+requested frequency) straight from the "Liquid" sheet, so Excel does not have to be opened to calculate the
+FORECAST formulas. Works the same way as the formulas: the value is taken from the straight line through the
+two measured rows around the frequency (MATCH(freq, A:A, 1) and the row after it).
+"""
+
+# Liquid sheet columns used in the Search sheet, in the order of Search sheet columns B-G
+SEARCH_COLUMNS = {
+    'e_target': 'J',
+    'sigma_target': 'L',
+    'e': 'B',
+    'sigma': 'D',
+    'e_delta': 'S',
+    'sigma_delta': 'U',
+}
+FREQUENCY_COLUMN = 'A'
+
+
+def _column_number(letter):
+    return ord(letter) - ord('A')
+
+
+def read_liquid(ws):
+    """Reads the measurement rows of the Liquid sheet: every row with a number in column A.
+    Returns a dict of float arrays with 'freq' and the keys of SEARCH_COLUMNS"""
+
+    columns = dict(SEARCH_COLUMNS, freq=FREQUENCY_COLUMN)
+    last_column = max(_column_number(letter) for letter in columns.values()) + 1
+    rows = []
+    for row in ws.iter_rows(max_col=last_column, values_only=True):
+        frequency = row[_column_number(FREQUENCY_COLUMN)]
+        if isinstance(frequency, (int, float)) and not isinstance(frequency, bool):
+            rows.append([row[_column_number(letter)] for letter in columns.values()])
+    values = np.array(rows, dtype=float).reshape(-1, len(columns))
+    return {key: values[:, number] for number, key in enumerate(columns)}
+
+
+def forecast(x, x1, x2, y1, y2):
+    """FORECAST(x, {y1, y2}, {x1, x2}) for arrays, least squares line through two points like in Excel"""
+
+    x_mean = (x1 + x2) / 2
+    y_mean = (y1 + y2) / 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = ((x1 - x_mean) * (y1 - y_mean) + (x2 - x_mean) * (y2 - y_mean)) / ((x1 - x_mean) ** 2 + (x2 - x_mean) ** 2)
+    return y_mean - slope * x_mean + slope * x
+
+
+class FrequencyIndex:
+    """Sorted index over the measured frequencies of a Liquid sheet. The values of all SEARCH_COLUMNS are kept
+    in one array in frequency order, so one bracket lookup per frequency gives every Search sheet value"""
+
+    def __init__(self, liquid):
+        order = np.argsort(liquid['freq'], kind='stable')
+        self.freq = liquid['freq'][order]
+        self.values = np.column_stack([liquid[key][order] for key in SEARCH_COLUMNS]).reshape(-1, len(SEARCH_COLUMNS))
+
+    def __len__(self):
+        return len(self.freq)
+
+    def bracket(self, frequencies):
+        """Returns (lower, in_range): index of the measured row below each frequency, the row after it is
+        the upper end, and which frequencies are inside the measured range"""
+
+        frequencies = np.asarray(frequencies, dtype=float)
+        # MATCH(freq, A:A, 1): last measured frequency that is not above freq, the row after it is used too
+        lower = np.searchsorted(self.freq, frequencies, side='right') - 1
+        if len(self) == 0:
+            return lower, np.zeros(len(frequencies), dtype=bool)
+        # the last measured frequency itself is taken from the last two rows
+        lower = np.where(frequencies == self.freq[-1], len(self) - 2, lower)
+        in_range = (lower >= 0) & (lower + 1 < len(self))
+        return np.clip(lower, 0, max(len(self) - 2, 0)), in_range
+
+    def out_of_range(self, frequencies):
+        """Returns the frequencies that are outside the measured range, in the given order"""
+
+        _, in_range = self.bracket(frequencies)
+        return [frequency for frequency, inside in zip(frequencies, in_range) if not inside]
+
+    def interpolate(self, frequencies):
+        """Returns an array with one row per frequency and the Search sheet columns A-G: frequency followed by
+        the SEARCH_COLUMNS values. Values of frequencies outside the measured range are NaN"""
+
+        frequencies = np.asarray(frequencies, dtype=float)
+        search = np.full((len(frequencies), len(SEARCH_COLUMNS) + 1), np.nan)
+        search[:, 0] = frequencies
+        if len(self) < 2:
+            return search
+        lower, in_range = self.bracket(frequencies)
+        upper = lower + 1
+        x = frequencies[:, np.newaxis]
+        values = forecast(x, self.freq[lower][:, np.newaxis], self.freq[upper][:, np.newaxis],
+                          self.values[lower], self.values[upper])
+        search[:, 1:] = np.where(in_range[:, np.newaxis], values, np.nan)
+        return search
+
+
+def interpolate(liquid, frequencies):
+    """Search sheet values of frequencies, see FrequencyIndex.interpolate"""
+
+    return FrequencyIndex(liquid).interpolate(frequencies)
@@ -1,197 +1,226 @@
-import pandas as pd
-import openpyxl as xl
-import math
 import glob
 import os, time
-import shutil
-import xlwings as xlw
 from datetime import datetime
-from docx import Document
-from docx.shared import Cm, Pt
+import sys
+if __name__ in ("__main__", "__mp_main__") and not __package__:     # started as python liquids.py, not imported from the package
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "Liquids"
+import atomic_files
+from . import frequency_table
+from . import liquid_manifest
+from . import liquid_params
+from . import report_index
 
 # Script to automate the boring parts of the workflow in SAR Lab and to reduce errors overall in reporting
 # 2020 summer by Arttu Mäkelä
+# pandas, openpyxl and python-docx are imported by the steps that use them, so starting the script is fast
 
 path = os.getcwd()
 doc_name = "Report.docx"
-frequencies_excel = "frequency table.xlsx"
-excel_files = glob.glob(os.path.join(path, "*.xlsx"))
-freq_excel_path = path + "\\" + frequencies_excel
-excel_files.remove(freq_excel_path)     # remove excel-document containing frequency table from list of files to be processed
-temp_excel = f"{path}\\~${frequencies_excel}"   
-if temp_excel in excel_files:    # in case user has frequencey-document open, remove it from list of excels to be processed
-    excel_files.remove(temp_excel)
-df = pd.read_excel(frequencies_excel, sheet_name='Sheet1')
-
-input_list = df.columns    
-print(df.columns[0]) 
-freq_list = []
-for c in range(df.columns.size):
-    print(df[input_list[c]])
-    freq_list.append(df[input_list[c]].to_list())
-count = 0
-for freq in freq_list:  
-    freq_list[count] = [x for x in freq if not math.isnan(x)]   # eliminates NaN-values from list
-    count += 1
-device_freqs = dict(zip(input_list.to_list(), freq_list))   # create a dictionary with Column names being keys and list of frequencies being values
-print(device_freqs)
-user_inputs = {} 
-print("Available bands:")
-for x in range(len(input_list)):
-    if (x/5).is_integer():
-        print("\n")
-    print(input_list[x], end ="   ") 
-print("\n")
-for excel_file in excel_files:
-    retry = True
-    excel_name = f"{excel_file}"
-    while retry == True:    # Asks user to input column names to use for Liquid-Excel
-        retry = False
-        user_inputs[excel_file] = []    # assign empty list as a value for dictionary, later to hold frequencies
-        file_name = excel_file.split(path + "\\")
-        print(f"Enter columns for {file_name[1]}:")
-        user_input = input()
-        parsed_input = user_input.split(",")
-        count = 0
-        for x in parsed_input:
-            parsed_input[count] = x.lstrip(' ')
-            x = parsed_input[count]
-            count += 1
-        for item in parsed_input:
-            value_entered = False
-            while not value_entered == True:
-                for key in device_freqs:
-                    if item == key:
-                        value_entered = True
-                    else:
-                        continue
-                    break
-                if value_entered == False:
-                    print("One or more column names were written incorrectly")
-                    user_inputs.clear()
-                    retry = True
-                    break
-                elif value_entered == True:
-                    for key, value in device_freqs.items():
-                        if key == item:
-                            user_inputs[excel_file].append(value)
-                        else:
-                            continue
-                        break
+default_frequencies_excel = "frequency table.xlsx"
+frequencies_excel = default_frequencies_excel   # may be in another folder, e.g. given with verkotan.py liquids --frequency-table
+cache_dir = os.path.join(os.path.expanduser("~"), ".liquids_cache")  # parsed frequency tables are kept here, None disables the cache
+body_style = "Liquid Table Text"
+header_style = "Liquid Table Header"
+report_attempts = 5     # times the rows are added again when the report is changed outside the script (e.g. saved in Word) meanwhile
+report_lock_timeout = 120   # seconds a run waits while another run adds its rows to the report
+manifest_file = None    # batch mode: columns of each excel file from a manifest, see liquid_manifest.py
+excel_files = []
+device_freqs = {}   # {column name in frequency table, list of frequencies}
+user_inputs = {}    # {excel file, list of frequency lists of the selected columns}
 excel_freq_amount = {}
+frequency_indexes = {}  # {excel file, liquid_params.FrequencyIndex of its Liquid sheet}
+search_values = {}  # {excel file, array of Search sheet values computed by liquid_params}
+user_freqs = {}     # {excel file, list of frequencies in Search sheet}
+out_of_scope = {}   # {excel file, list of frequencies outside the measured range}
 
-# construct the Excel file 
-for excel_file in excel_files:
-    wb = xl.load_workbook(excel_file)
-    ws = wb.active
-    ws.title = "Liquid"
-    liquid = f"'Liquid'"
-    wb.create_sheet("Search", 1)
-    ws2 = wb["Search"]
-    ws2['A1'] = "Freq"
-    ws2['B1'] = "e' target"
-    ws2['C1'] = "(S/m) target"
-    ws2['D1'] = "e'"
-    ws2['E1'] = "(S/m)"
-    ws2['F1'] = "e' delta %"
-    ws2['G1'] = "(S/m) delta %"
+def file_state(file_name):
+    """(size, modification time) of a file, None if it does not exist"""
+    try:
+        stat = os.stat(file_name)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
 
-    final_freq_list = []
-    for item in user_inputs[excel_file]:
-        for value in item:
-            final_freq_list.append(value)
-    count = 2
-    for cell in range(len(final_freq_list)):
-        frequency = final_freq_list[count - 2]
-        ws2[f'A{count}'] = frequency
-        ws2[f'B{count}'] = f'=FORECAST($A{count},OFFSET(INDIRECT("{liquid}!J:J"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2), OFFSET(INDIRECT("{liquid}!A:A"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2))'
-        ws2[f'C{count}'] = f'=FORECAST($A{count},OFFSET(INDIRECT("{liquid}!L:L"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2), OFFSET(INDIRECT("{liquid}!A:A"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2))'
-        ws2[f'D{count}'] = f'=FORECAST($A{count},OFFSET(INDIRECT("{liquid}!B:B"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2), OFFSET(INDIRECT("{liquid}!A:A"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2))'
-        ws2[f'E{count}'] = f'=FORECAST($A{count},OFFSET(INDIRECT("{liquid}!D:D"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2), OFFSET(INDIRECT("{liquid}!A:A"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2))'
-        ws2[f'F{count}'] = f'=FORECAST($A{count},OFFSET(INDIRECT("{liquid}!S:S"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2), OFFSET(INDIRECT("{liquid}!A:A"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2))'
-        ws2[f'G{count}'] = f'=FORECAST($A{count},OFFSET(INDIRECT("{liquid}!U:U"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2), OFFSET(INDIRECT("{liquid}!A:A"),MATCH($A{count},INDIRECT("{liquid}!A:A"),1)-1,0,2))'
-        count += 1
-    wb.save(excel_file)
-    wb.close()
-    freqs = count - 2
-    excel_freq_amount[excel_file] = freqs
+def find_excel_files():
+    """Lists the liquid excel files in the folder, everything except the frequency table. The default frequency
+    table is left out too when another table is used"""
+    global excel_files
+    excel_files = glob.glob(os.path.join(path, "*.xlsx"))
+    tables = [os.path.abspath(frequencies_excel), os.path.join(path, default_frequencies_excel)]
+    for table in tables:
+        folder, name = os.path.split(table)
+        temp_excel = os.path.join(folder, f"~${name}")  # in case user has frequency-document open
+        excel_files = [excel_file for excel_file in excel_files
+                       if os.path.abspath(excel_file) not in (table, temp_excel)]
 
-freq_count = 0   
-for key, value in excel_freq_amount.items():
-    freq_count += value
+def read_frequency_table():
+    """Reads the columns of the frequency table to device_freqs and returns the column names. The parsed table
+    comes from frequency_table.py's cache when the excel file has not changed since the last run"""
+    try:
+        table = frequency_table.load_table(frequencies_excel, cache_dir)
+    except (OSError, ValueError) as error:
+        print(f"ERROR: {frequencies_excel}: {error}")
+        sys.exit(1)
+    device_freqs.update(table)   # Column names being keys and list of frequencies being values
+    print(f"{len(table)} columns in {frequencies_excel}")
+    return list(table)
 
-def save_formulas(excel_file):
-    app = xlw.App(visible=False)
-    book = app.books.open(excel_file)
+def read_manifest():
+    """Batch mode: takes the columns of each excel file from manifest_file, only the files in it are processed"""
+    global excel_files
+    excel_names = {os.path.split(excel_file)[1]: excel_file for excel_file in excel_files}
     try:
-        book.save()
-        book.close()
-        app.quit()
-    except:
-        book.close()
-        app.quit() 
+        manifest = liquid_manifest.read_manifest(manifest_file)
+    except (OSError, ValueError) as error:
+        print(f"ERROR: {error}")
+        sys.exit(1)
+    errors = liquid_manifest.validate(manifest, device_freqs, excel_names)
+    if errors:
+        for error in errors:
+            print(f"ERROR: {error}")
+        sys.exit(1)
+    excel_files = [excel_names[excel_name] for excel_name in manifest]
+    for excel_file in excel_files:
+        user_inputs[excel_file] = [device_freqs[column] for column in manifest[os.path.split(excel_file)[1]]]
+
+def ask_columns(input_list):
+    """Asks the user to input the column names to use for each excel file"""
+    print("Available bands:")
+    for x in range(len(input_list)):
+        if (x/5).is_integer():
+            print("\n")
+        print(input_list[x], end ="   ") 
+    print("\n")
+    for excel_file in excel_files:
+        file_name = os.path.split(excel_file)
+        while excel_file not in user_inputs:    # Asks user to input column names to use for Liquid-Excel
+            print(f"Enter columns for {file_name[1]}:")
+            parsed_input = liquid_manifest.parse_columns(input())
+            if parsed_input and set(parsed_input) <= device_freqs.keys():
+                user_inputs[excel_file] = [device_freqs[item] for item in parsed_input]
+            else:
+                print("One or more column names were written incorrectly")
+
+def check_frequencies():
+    """Reads the Liquid sheet of each excel file and lists the selected frequencies outside its measured range in
+    out_of_scope. All files are checked before any of them is changed"""
+    import openpyxl as xl
+    for excel_file in excel_files:
+        user_freqs[excel_file] = [value for item in user_inputs[excel_file] for value in item]
+        wb = xl.load_workbook(excel_file, read_only=True)
+        try:
+            frequency_indexes[excel_file] = liquid_params.FrequencyIndex(liquid_params.read_liquid(wb.active))
+        finally:
+            wb.close()
+        missing = frequency_indexes[excel_file].out_of_range(user_freqs[excel_file])
+        if missing:
+            out_of_scope[excel_file] = missing
+
+def construct_excels():
+    """Adds the Search sheet to each excel file and computes its values, run after check_frequencies found all
+    frequencies in range. A Search sheet left by an earlier run is replaced"""
+    import openpyxl as xl
+    for excel_file in excel_files:
+        wb = xl.load_workbook(excel_file)
+        ws = wb.active
+        final_freq_list = user_freqs[excel_file]
+        ws.title = "Liquid"
+        if "Search" in wb.sheetnames:
+            wb.remove(wb["Search"])
+        liquid = f"'Liquid'"
+        wb.create_sheet("Search", 1)
+        ws2 = wb["Search"]
+        ws2['A1'] = "Freq"
+        ws2['B1'] = "e' target"
+        ws2['C1'] = "(S/m) target"
+        ws2['D1'] = "e'"
+        ws2['E1'] = "(S/m)"
+        ws2['F1'] = "e' delta %"
+        ws2['G1'] = "(S/m) delta %"
+        ws2['H1'] = "Liquid row"
+
+        count = 2
+        for cell in range(len(final_freq_list)):
+            frequency = final_freq_list[count - 2]
+            ws2[f'A{count}'] = frequency
+            # row of the measured frequency below, looked up once and used by all FORECAST formulas of the row
+            ws2[f'H{count}'] = f'=MATCH($A{count},{liquid}!A:A,1)'
+            for search_column, letter in zip("BCDEFG", liquid_params.SEARCH_COLUMNS.values()):
+                ws2[f'{search_column}{count}'] = (f'=FORECAST($A{count},INDEX({liquid}!{letter}:{letter},$H{count}):INDEX({liquid}!{letter}:{letter},$H{count}+1), '
+                                                 f'INDEX({liquid}!A:A,$H{count}):INDEX({liquid}!A:A,$H{count}+1))')
+            count += 1
+        # same values as the formulas above, calculated here so Excel is not needed to read them
+        search_values[excel_file] = frequency_indexes[excel_file].interpolate(final_freq_list)
+        atomic_files.replace_atomic(excel_file, wb.save)   # other runs and Excel never see a half-written file
+        wb.close()
+        freqs = count - 2
+        excel_freq_amount[excel_file] = freqs
+
+def report_out_of_scope():
+    """Lists all frequencies outside the measured range and exits"""
+    for excel_file, frequencies in out_of_scope.items():
+        file_name = os.path.split(excel_file)
+        print(f"ERROR: Frequencies {', '.join(f'{frequency:g}' for frequency in frequencies)} in {file_name[1]} out of scope")
+    if not manifest_file:   # leave the message on screen for the user
+        time.sleep(5)
+    sys.exit(1)
+
+def table_row(date_now, frequency, values):
+    """Returns the Word table row of one frequency, values are the Search sheet values after the frequency"""
+    return [date_now, "WB Head", "22", frequency] + [round(value, 2) for value in values]
+
+def table_rows(excel_file, date_now):
+    """Returns the rows of one excel file for the Word table"""
+    rows = []
+    for x, row_values in enumerate(search_values[excel_file].tolist()):
+        rows.append(table_row(date_now, user_freqs[excel_file][x], row_values[1:]))
+    return rows
+
+def new_rows(written):
+    """Returns the table rows of all excel files that are not in the report yet and their index entries.
+    Rows with a (file, frequency, date) already in written are skipped, written is updated with the new rows"""
+    date_now = datetime.today().strftime(f'%d.%m.%Y')
+    rows = []
+    entries = []
+    for excel_file in excel_files:
+        file_name = os.path.split(excel_file)
+        file_rows = table_rows(excel_file, date_now)
+        skipped = 0
+        for row in file_rows:
+            row_entry = report_index.entry(file_name[1], row[3], date_now)
+            if row_entry in written:    # already in the report or a frequency selected twice
+                skipped += 1
+                continue
+            written.add(row_entry)
+            entries.append(row_entry)
+            rows.append(row)
+        if skipped:
+            print(f"{file_name[1]} done, {skipped} rows already in {doc_name} skipped")
+        else:
+            print(f"{file_name[1]} done")
+    return rows, entries
+
 def update_table():
+    """Returns the report with the new rows added and their index entries, None if there are no new rows"""
+    rows, entries = new_rows(report_index.load_index(doc_name))
+    if not rows:    # nothing new, the report is not opened at all
+        print(f"No new rows for {doc_name}")
+        return None
+    from docx import Document
+    import report_table
     document = Document(doc_name)
     table = document.tables[0]
-    date_now = datetime.today().strftime(f'%d.%m.%Y')
-    for excel_file in excel_files:
-        save_formulas(os.path.basename(excel_file))
-        wb = xl.load_workbook(excel_file, data_only=True)
-        ws = wb['Search']
-        row_amount = excel_freq_amount[excel_file]
-        file_name = excel_file.split(path + "\\")
-        try:
-            row_num = 0
-            for row in table.rows:
-                row_num += 1
-            for x in range(row_amount):
-                table.add_row()
-                first_header = table.rows[0].cells
-                header_cells = table.rows[1].cells
-                this_row = table.rows[row_num].cells
-                this_row[0].text = date_now
-                this_row[1].text = "WB Head"
-                this_row[2].text = "22"
-                str3 = ws.cell(row=x+2, column=1).value
-                str4 = round(ws.cell(row=x+2, column=2).value,2)
-                str5 = round(ws.cell(row=x+2, column=3).value,2)
-                str6 = round(ws.cell(row=x+2, column=4).value,2)
-                str7 = round(ws.cell(row=x+2, column=5).value,2)
-                str8 = round(ws.cell(row=x+2, column=6).value,2)
-                str9 = round(ws.cell(row=x+2, column=7).value,2)
-                this_row[3].text = str(str3)
-                this_row[4].text = str(str4)
-                this_row[5].text = str(str5)
-                this_row[6].text = str(str6)
-                this_row[7].text = str(str7)
-                this_row[8].text = str(str8)
-                this_row[9].text = str(str9)
-                row_num +=1
-        except TypeError:
-            print(f"ERROR: Frequencies in {file_name[1]} out of scope")
-            time.sleep(5)
-            exit()        
-        print(f"{file_name[1]} done")
-    for row in table.rows:
-        for cell in row.cells:
-            paragraphs = cell.paragraphs
-            for paragraph in paragraphs:
-                for run in paragraph.runs:
-                    font = run.font
-                    font.size= Pt(7)
-    headers = header_cells + first_header
-    for cell in headers:
-        paragraphs = cell.paragraphs
-        for paragraph in paragraphs:
-            for run in paragraph.runs:
-                font = run.font 
-                font.size = Pt(8)
-                font.bold = True
-    document.save(doc_name)
-    wb.close()
-def create_table():
+    report_table.paragraph_style(document, body_style, 7)   # documents made by older versions lack the style
+    report_table.add_rows(table, rows, body_style)
+    return document, entries
+
+def new_document():
+    """Returns a new report and its table with only the header rows"""
+    from docx import Document
+    import report_table
     document = Document()
-    table = document.add_table(rows=freq_count+2, cols=10)
+    table = document.add_table(rows=2, cols=10)
     table.allow_autofit = False
     table.style = document.styles['Table Grid']
     first_header = table.rows[0].cells
@@ -212,62 +241,59 @@ def create_table():
     header_cells[7].text = "Conductivity \u03C3 [S/m]"
     header_cells[8].text = "\u03B5 (%)"
     header_cells[9].text = "\u03C3 (%)"
-    date_now = datetime.today().strftime(f'%d.%m.%Y')
-    row_num = 2
-    for excel_file in excel_files:
-        save_formulas(os.path.basename(excel_file))
-        wb = xl.load_workbook(excel_file, data_only=True)
-        ws = wb['Search']
-        file_name = excel_file.split(path + "\\")
-        try:
-            row_amount = excel_freq_amount[excel_file]
-            for x in range(row_amount):
-                this_row = table.rows[row_num].cells
-                this_row[0].text = date_now
-                this_row[1].text = "WB Head"
-                this_row[2].text = "22"
-                str3 = ws.cell(row=x+2, column=1).value
-                str4 = round(ws.cell(row=x+2, column=2).value,2)
-                str5 = round(ws.cell(row=x+2, column=3).value,2)
-                str6 = round(ws.cell(row=x+2, column=4).value,2)
-                str7 = round(ws.cell(row=x+2, column=5).value,2)
-                str8 = round(ws.cell(row=x+2, column=6).value,2)
-                str9 = round(ws.cell(row=x+2, column=7).value,2)
-                this_row[3].text = str(str3)
-                this_row[4].text = str(str4)
-                this_row[5].text = str(str5)
-                this_row[6].text = str(str6)
-                this_row[7].text = str(str7)
-                this_row[8].text = str(str8)
-                this_row[9].text = str(str9)
-                row_num +=1
-        except TypeError:
-            file_name = excel_file.split(path + "\\")
-            print(f"ERROR: Frequencies in {file_name[1]} out of scope")
-            time.sleep(6)
-            exit()
-        print(f"{file_name[1]} done")
-    headers = header_cells + first_header
-    for row in table.rows:
-        for cell in row.cells:
-            paragraphs = cell.paragraphs
-            for paragraph in paragraphs:
-                for run in paragraph.runs:
-                    font = run.font
-                    font.size= Pt(7)
-    for cell in headers:
-        paragraphs = cell.paragraphs
-        for paragraph in paragraphs:
-            for run in paragraph.runs:
-                font = run.font 
-                font.size = Pt(8)
-                font.bold = True
-    document.save(doc_name)
-    wb.close()
+    report_table.paragraph_style(document, body_style, 7)
+    report_table.paragraph_style(document, header_style, 8, bold=True)
+    report_table.style_cells(header_cells + first_header, header_style)
+    return document, table
+
+def create_table():
+    """Returns a new report with the rows of all excel files and their index entries"""
+    import report_table
+    document, table = new_document()
+    rows, entries = new_rows(set())
+    report_table.add_rows(table, rows, body_style)
+    return document, entries
+
+def write_report():
+    """Creates the report or adds the new rows to it. The run holds the lock of the report (atomic_files.file_lock)
+    from reading the report and its index until its rows are in both, so runs on a shared folder add their rows
+    one at a time and none of them is lost. The report is saved under a temporary name and renamed over doc_name
+    if it was not changed outside the script since it was read, otherwise the rows are added again"""
+    try:
+        with atomic_files.file_lock(doc_name, report_lock_timeout):
+            for _ in range(report_attempts):
+                state = file_state(doc_name)
+                new_report = state is None
+                report = create_table() if new_report else update_table()
+                if report is None:
+                    return
+                document, entries = report
+                if not atomic_files.replace_atomic(doc_name, document.save, lambda: file_state(doc_name) == state):
+                    print(f"{doc_name} was changed meanwhile, adding the rows again")
+                    continue
+                report_index.add_entries(doc_name, entries, new_index=new_report)
+                return
+    except TimeoutError as error:
+        print(f"ERROR: {error}, rows were not added. Run the script again")
+        sys.exit(1)
+    print(f"ERROR: {doc_name} kept changing, rows were not added. Run the script again")
+    sys.exit(1)
+
+
+def main(manifest=None):
+    global manifest_file
+    manifest_file = manifest
+    find_excel_files()
+    input_list = read_frequency_table()
+    if manifest_file:
+        read_manifest()
+    else:
+        ask_columns(input_list)
+    check_frequencies()
+    if out_of_scope:
+        report_out_of_scope()
+    construct_excels()
+    write_report()
 
-if os.path.exists(doc_name):
-    update_table()
-else:
-    create_table()
-#print(input_list)
-#print(freq_list)
\ No newline at end of file
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,46 @@
+import json
+import os
+
+"""
+Sidecar index of the rows already written to the liquid parameter report. The index is a text file next to
+Report.docx with one JSON line [excel file, frequency, date] per table row, so a run can tell which rows are new
+without reading the Word table, and only appends the lines of its own rows to the index.
+Rows written before the index existed are not in it.
+"""
+
+
+def index_name(doc_name):
+    """Name of the index file of a report, e.g. Report.docx -> Report.index.jsonl"""
+
+    return os.path.splitext(doc_name)[0] + ".index.jsonl"
+
+
+def entry(file_name, frequency, date):
+    """Index key of one table row"""
+
+    return (file_name, float(frequency), date)
+
+
+def load_index(doc_name):
+    """Returns the set of (file, frequency, date) entries written to the report, empty if there is no index.
+    Lines that can not be read (e.g. a half-written last line) are skipped"""
+
+    entries = set()
+    try:
+        with open(index_name(doc_name), encoding="utf-8") as index:
+            for line in index:
+                try:
+                    entries.add(entry(*json.loads(line)))
+                except (ValueError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def add_entries(doc_name, entries, new_index=False):
+    """Appends entries to the index of the report, new_index starts the index over for a new report"""
+
+    with open(index_name(doc_name), "w" if new_index else "a", encoding="utf-8") as index:
+        for file_name, frequency, date in entries:
+            index.write(json.dumps([file_name, frequency, date]) + "\n")
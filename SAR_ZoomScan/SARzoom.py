@@ -1,14 +1,23 @@
-import pandas as pd
-import openpyxl as xl
-import xlwings as xlw
+import cProfile
+import errno
 import glob
 import os
 import time
 import shutil
+import signal
+import sys
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from docx import Document
-from docx.shared import Cm
-from docx.shared import RGBColor
+if __name__ in ("__main__", "__mp_main__") and not __package__:     # started as python SARzoom.py, not imported from the package
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = "SAR_ZoomScan"
+import atomic_files
+from . import export_cache
+from . import result_table
+from . import stage_timer
+from . import zoomscan
 
 """
 This script automates portions of the SAR data analysis process. SEMCAD data is exported
@@ -17,9 +26,13 @@ all the text files in script folder. The results (which files passed/failed) are
 user in command-line interface and all handled txt files and excel file are moved to a subfolder along
 with a log.txt file detailing what was done with the script and when.
 Notable class libraries used:
-    Pandas class library to read .txt files and write data to excel sheets.
-    Openpyxl class library is used to modify cells within the excel file.
-    Xlwings to open Excel-document in background (required for accessing formula values)
+    Pandas class library to read .txt files (semcad_export.py). Each file is parsed once, the points are
+    memory-mapped (export_cache.py) by the evaluation workers and the excel stage instead of being copied.
+    Numpy (zoomscan.py) to evaluate each zoom scan, Excel is not needed for the results.
+    Numpy (volume_average.py) for the peak 1 g and 10 g average SAR of the whole zoom scan volume.
+    Openpyxl class library is used to write the excel file with formulas for auditing the results.
+    Openpyxl and python-docx are imported by the functions that write the files, so they are not loaded
+    when they are not needed (e.g. create_audit_excel = False).
 
 IMPORTANT FOR USER: currently script attempts to handle all .txt files in its directory. This means that
 script directory should only have relevant .txt files (SEMCAD data exports in .txt or .csv format) in it.
@@ -32,274 +45,133 @@ Supervisor: Ilari Kinnunen
 start_time = time.time()
 path = os.getcwd()
 ignore_list = [] # specify the .txt files you don't want to be read by the script here
-all_files = glob.glob(os.path.join(path, "*.txt")) # creates a list of all txt files within directory
+all_files = sorted(glob.glob(os.path.join(path, "*.txt"))) # creates a sorted list of all txt files within directory
 excel_file_name = 'results.xlsx'
-
-allowed_step_sizes = [0.0075, 0.004, 0.005] # edit this if new step sizes are introduced
+create_audit_excel = True   # set to False to skip creating results.xlsx, results are computed without it
+
+allowed_step_sizes = list(zoomscan.ALLOWED_STEP_SIZES) # new step sizes are added to ALLOWED_STEP_SIZES in zoomscan.py
+surface_distance = 0.0 # m from the phantom surface to the lowest measurement layer, peak 1 g / 10 g SAR is extrapolated over it. None skips the averages
+number_of_workers = os.cpu_count() # processes evaluating files in parallel, 1 evaluates them one by one
+cache_dir = os.path.join(os.path.expanduser("~"), ".sarzoom_cache") # parsed exports are kept here, None disables the cache
+cache_max_size = 2 * 1024**3 # bytes, least recently used exports are removed from the cache above this
+store_dir = None    # parsed exports of the run are memory-mapped from here by all stages: cache_dir, or a temporary folder when the cache is disabled
 number_of_sheets = len(all_files) 
-file_dict = {}
-step_errors = {}
-pass_rate = 0
+results_table = result_table.ResultTable()    # one ScanResult per file in all_files order, read by every report
 doc_name = "Report.docx"
 log_file_name = "log.txt"
+timing_file_name = "timing.json"    # wall/CPU time and peak memory of each stage, saved next to log.txt
+profile_run = False     # set to True to save a cProfile dump (profile.prof) next to log.txt, number_of_workers = 1 includes the evaluation
+poll_interval = 1   # seconds between checks of the inbox in watch mode
+settle_time = 2     # seconds an export has to stay unchanged before it is handled in watch mode
+excel_interval = 300    # seconds between saves of results.xlsx in watch mode, it is saved also when watch mode stops
 # parsing current time for later use in folder names/reports
 current_time = str(time.asctime(time.localtime(time.time())))
 folder_time = current_time.replace(":", "-")
 sub_dir_parse = folder_time.replace(" ", "_")
 sub_dir_name = sub_dir_parse.replace("__", "_")
-
-def create_excel():
-    """Reads a list of .txt files and writes them to one excel file, each text file in its own worksheet"""
-    try:
-        writer = pd.ExcelWriter(excel_file_name) 
-        for f in all_files:
-            df = pd.read_csv(f, na_values = ['--'] ,skiprows=4,sep="\t\t", engine='python').dropna()    # reads file, skipping first 5 rows and ignoring lines with "--" values  
-            df.to_excel(writer, sheet_name=os.path.basename(f))
-        writer.save()
-    except:     # catches the error and tells the user to include .txt files in directory
-        print("Error reading txt files")
-        time.sleep(5)
-        exit()
-
-def fill_excel_phase_one():
-    """ Creating various excel cells/formulas. Excel creation is separated into 3 phases, because some values that appear 
-    in excel formulas cannot be accessed unless that excel file is opened (this excel opening in background is done by 
-    "open_excel_in_background" function). For example, in phase_two we need variables that are in excel formulas
-    created in phase_one."""
-
-    print("Creating Excel sheets")
-    # populates excel file and its sheets with various cells
-    for f in all_files:
-        ws = wb[f'{os.path.basename(f)}'] # assigns the correct worksheet to the variable
-
-        # parsing the text file for certain Grid values for later use in Excel tables
+data_dir = os.path.join(path, 'SEMCAD_data')
+workspace = None    # hidden folder under data_dir where this run works, renamed to data_dir/run_id when the run is done
+run_id = sub_dir_name   # name of the run folder, _2, _3... is added if another run has already taken the name
+
+def stop_workers(executor):
+    """Cancels the files not yet evaluated when the run stops on an error, so they are not evaluated for nothing"""
+
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def evaluate_files():
+    """Reads each .txt file and evaluates its zoom scan with zoomscan.py. Adds the results of each file, tagged
+    as Fail, Pass or Error, to results_table, no Excel is needed for the results. With more than one worker
+    the files are evaluated in parallel processes, results are still handled in all_files order"""
+
+    print("Evaluating zoom scans")
+    workers = min(number_of_workers or 1, number_of_sheets)
+    if workers > 1:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        jobs = [executor.submit(zoomscan.evaluate_file, f, allowed_step_sizes, store_dir, surface_distance) for f in all_files]
+    else:
+        executor = None
+        jobs = [None] * number_of_sheets
+    for f, job in zip(all_files, jobs):
         try:
-            get_grids = open(f'{os.path.basename(f)}')  
-            lines = get_grids.readlines()
-            grid_line = lines[3]
-            grids = grid_line.split("Grid: ")
-            grid_values = grids[1].split("x")
-            get_grids.close()
-            grid_x_value = float(grid_values[0])
-            grid_y_value = float(grid_values[2])
+            if job is None:
+                results = zoomscan.evaluate_file(f, allowed_step_sizes, store_dir, surface_distance)
+            else:
+                results = job.result()
         except IndexError as error:     # catching an error and telling the user to export data in proper format from SEMCAD
-            get_grids.close()
             print(error)
             print(f"Error handling file: {os.path.basename(f)} -> Make all sure SAR field exports are exported with headers and try again")
+            stop_workers(executor)
             time.sleep(6)
             exit()
-        # converting some values to floats (initially strings)
-        for row in ws.iter_rows(min_row=3, max_col=5):
-            for cell in row:                  
-                    cell.value = float(cell.value)
-        number_of_cells = 0
-        for row in ws.iter_rows(min_row=3, max_col=1):
-            number_of_cells += 1
-
-        ws['J2'] = "MAX Value of SAR [W/kg]"
-        ws['J3'] = f"=MAX(B3:B{number_of_cells + 2})"
-        ws['J4'] = "Cell number of MAX value SAR"
-        ws['J5'] = "=MATCH(MAX(B:B),B:B,0)"
-        ws['G1'] = "X(m)"
-        ws['H1'] = "Y(m)"
-        ws['G2'] = "Rounded"
-        ws['H2'] = "Rounded"
-        ws['N2'] = "X(m)"
-        ws['O2'] = "Y(m)"
-        ws['P2'] = "Z(m)"
-
-        # creating rounded X and Y columns, used for getting step size 
-        cell_number = 3
-        for row in ws.iter_rows(min_row=3, min_col=7, max_col=7):
-            for cell in row:
-                cell.value = f"=ROUND(C{cell_number}-C$3,3)+C$3"
-                cell_number += 1
-        cell_number = 3
-        for row in ws.iter_rows(min_row=3, min_col=8, max_col=8):
-            for cell in row:
-                cell.value = f"=ROUND(D{cell_number}-D$3,3)+D$3"
-                cell_number += 1
-
-        ws['N3'] = f"=INDEX(C3:C{number_of_cells + 2},MATCH(MAX(B3:B{number_of_cells + 2}),B3:B{number_of_cells + 2},0))"
-        ws['O3'] = f"=INDEX(D3:D{number_of_cells + 2},MATCH(MAX(B3:B{number_of_cells + 2}),B3:B{number_of_cells + 2},0))"
-        ws['P3'] = f"=INDEX(E3:E{number_of_cells + 2},MATCH(MAX(B3:B{number_of_cells + 2}),B3:B{number_of_cells + 2},0))"
-        ws['J7'] = "Point M2 (Cell value of MAX Value SAR + 1)"
-        ws['K3'] = "=(MATCH(MAX(B:B),B:B,0))+1"
-        ws['J10'] = "X- & Y-axis zoom scan step size (m)"
-
-        ws['Z2'] = "Is Point next to SAR peak below 3dB?"
-        ws['Z5'] = "%-Ratio between m2 and m1: (>=30%)"
-        ws['Z8'] = "Re-measurement required?"
-        ws['Z11'] = "Minimum distance?"
-
-        ws['AA12'] = "mm"
-        ws['Z9'] = '=IF(AND(Z3="No", Z6>=30%), "No", "Yes")'
-        
-        ws['O9'] = "gx"
-        ws['P9'] = "gy"
-        ws['O10'] = grid_x_value
-        ws['P10'] = grid_y_value
-        ws['R1'] = "Lowest measurement points:"
-        ws['R2'] = "SAR"
-        ws['S2'] = "X"
-        ws['T2'] = "Y"
-        data_to_grid_ratio = int(number_of_cells/grid_y_value)
-        count = 0
-        for cells in range(data_to_grid_ratio):
-            ws[f'R{3 + count}'] = "=OFFSET($B$3,(ROW()-3)*$P$10,0)"
-            ws[f'S{3 + count}'] = "=OFFSET($C$3,(ROW()-3)*$P$10,0)"
-            ws[f'T{3 + count}'] = "=OFFSET($D$3,(ROW()-3)*$P$10,0)"
-            ws[f'V{3 + count}'] = f"=SQRT((S{3 + count}-$N$3)^2+(T{3 + count}-$O$3)^2)"
-            ws[f'W{3 + count}'] = f"=IF(V{3 + count}<($J$11+($J$11/10)),TRUE,FALSE)"
-            ws[f'X{3 + count}'] = f'=IF(AND(W{3 + count}=TRUE, (R{3 + count}/$J$3)<=0.501187),"FAIL", "PASS")'
-            count += 1
-        ws['Z3'] = f'=IF(COUNTIF(X3:X{2 + data_to_grid_ratio},"FAIL"),"Yes","No")'
-        ws['AE2'] = "Minimum distance"
-        count = 0
-        for cells in range(data_to_grid_ratio):
-            ws[f'AE{3 + count}'] = f"=ROUND(IF(R{3 + count}/$J$3<0.5, V{count +3}, 0), 4)"
-            count += 1
-        ws['Z12'] = f"=SMALL(AE3:AE{data_to_grid_ratio + 2},COUNTIF($AE$3:$AE${data_to_grid_ratio + 2},0)+1)*1000"
-    wb.save(excel_file_name)
-
-def open_excel_in_background(excel_file_name):
-    """Opens the Excel-document in background and then saves/closes it.
-    Needed in order to access values in cell formulas later in script"""
-
-    app = xlw.App(visible=False)
-    book = app.books.open(excel_file_name)
-    try:
-        book.save()
-        book.close()
-        app.quit()
-    except:
-        book.close()
-        app.quit() 
-
-def fill_excel_phase_two():
-    """Fills parts of Excel-document, most importantly determining step size value"""
-    for f in all_files:
-        ws = wb[f'{os.path.basename(f)}']
-        ws2 = wb2[f'{os.path.basename(f)}'] 
-        point_m1 = ws2['J3'].value
-        point_m2 = ws2['K3'].value
-        ws['J8'] = f"=B{point_m2}"
-        ws['Z6'] = f"=J8/J3 *100"
-        
-        # calculates step size used in the respective SAR zoom scan
-        count = 1
-        for rows in ws2.iter_rows(min_row=3, min_col=7, max_col=7):
-            for cell in rows:
-                if count > 1:
-                    current_cell = cell.value
-                    prev_cell = ws2.cell(row=(cell.row-1), column =7).value
-                    if current_cell != prev_cell:
-                        step = abs(prev_cell-current_cell)
-                        break
-                    else:
-                        continue
-                    break
-                else:
-                    count += 1
-                    continue
-                break
-            else:
-                continue
-            break
-        if step > 0.0065 and step < 0.009:
-            step_size_rounded = 0.0075
-        else:
-            step_size_rounded = float(round(step, 4))
-        if step_size_rounded not in allowed_step_sizes:
-            step_errors[f] = True
-        ws['J11'] = step_size_rounded
-
-    wb2.save(excel_file_name)
-    wb.save(excel_file_name)
-    wb2.close()
-
-def fill_excel_phase_three():
-    """Fills finals parts of the Excel-document. Marks the files as Fails, Passes or Errors
-    depeding on a string within an excel cell and recolors/organizes the worksheets based on outcome"""
+        except:     # catches the error and tells the user to include .txt files in directory
+            print("Error reading txt files")
+            stop_workers(executor)
+            time.sleep(5)
+            exit()
+        results_table.append(result_table.ScanResult.from_results(f, results))
+    if executor is not None:
+        executor.shutdown()
+    if cache_dir is not None:
+        export_cache.evict(cache_dir, cache_max_size)
 
-    for f in all_files:
-        ws3 = wb3[f"{os.path.basename(f)}"]
-        sheet_title = os.path.basename(f)
-        ws = wb[f"{os.path.basename(f)}"]
-        # parse a particular line from file and use it as file name
-        parse_file = open(f'{os.path.basename(f)}')
-        lines = parse_file.readlines()
-        line_of_filename = lines[2]        # sets 3rd line of .txt file to the variable
-            
-        split_1 = line_of_filename.split("/Program/")       # two splitting operations to extract a name for .txt file
-        split_2 = split_1[1].split("/")     # use the name between "/Program/" and "/" as the 
-        sheet_title = split_2[0]
-        parse_file.close()
-
-        ws['J13'] = 'filename'
-        ws['J14'] = f"{sheet_title}"
-        result = ws3['Z9'].value    # sets the value in cell V9 to the variable, either "Yes" or "No"
-        os.rename(os.path.basename(f), f"{sheet_title}" + ".txt")
-        # checking whether the cell contains the string "Yes" or "No"
-        # and classifies the file as "FAIL","PASS" or "ERROR" depending on value
-        if result == "No":
-            file_dict[f] = "Pass"
-        elif result == "Yes":
-            file_dict[f] = "Fail"
-            ws.sheet_properties.tabColor = '00FF0000'    
-        if f in step_errors.keys():
-            if step_errors[f] == True:
-                file_dict[f] = "Error"
-                ws.sheet_properties.tabColor = '00FFFB00'
-    wb3.save(excel_file_name)
-    wb.save(excel_file_name)
+def workbook_sheets():
+    """(sheet title, export file, results) of each file in results_table for audit_workbook.py"""
+
+    return [(os.path.basename(record.file), record.file, record.as_dict()) for record in results_table]
+
+def create_excel():
+    """Writes all evaluated files to one excel file, each text file in its own worksheet with the formulas
+    used for auditing the results. Formulas are calculated when the file is opened in Excel, the script itself
+    does not need their values. The file is written in one pass, see audit_workbook.py"""
+
+    from . import audit_workbook
+    print("Creating Excel sheets")
+    audit_workbook.write_workbook(os.path.join(workspace, excel_file_name), workbook_sheets(), store_dir)
     print("Excel file created successfully")
 
-    wb._sheets.sort(key=lambda ws: ws.title)
-    wb3.save(excel_file_name)
-    wb.save(excel_file_name)
-    wb.close()
-    wb3.close()
+def rename_files():
+    """Renames each .txt file after the name between "/Program/" and "/" in its header, _2, _3... is added
+    to files with the same name"""
+
+    for number, (f, filename) in enumerate(zip(results_table.column('file'), results_table.column('filename'))):
+        if os.path.basename(f) == f"{filename}.txt":
+            continue
+        all_files[number] = unique_path(workspace, f"{filename}", ".txt")
+        os.rename(f, all_files[number])
+        results_table.set(number, 'file', all_files[number])
 
 def print_results():
     """Prints results in CLI showing most important info about the analysed files"""
 
-    fails = 0
     print("Test complete.\n")
-    if "Error" in file_dict.values():
-        print("The following files have a step size error:")
-        print("---------------------------------")
-        for key, value in file_dict.items():
-            if value == "Error":
-                ws = wb[f"{os.path.basename(key)}"]
-                filename = ws['J14'].value
-                print(filename)  
-                fails += 1
-        print("---------------------------------")    
-    if "Fail" in file_dict.values():
-        print("The following files are tagged as 'FAIL':")
-        print("---------------------------------")
-        for key, value in file_dict.items():
-            if value == "Fail":
-                ws = wb[f"{os.path.basename(key)}"]
-                filename = ws['J14'].value
-                print(filename)
-                fails += 1
-        print("---------------------------------")
-        pass_rate = (number_of_sheets - fails)/number_of_sheets * 100
-        print(f"{number_of_sheets} files processed with a PASS rate of {'%.1f' % pass_rate} %\n")
+    verdicts = results_table.by_verdict()
+    groups = (
+        ("The following files have a non-uniform measurement grid:", results_table.where('uniform_grid', False)),
+        ("The following files have a step size error:", verdicts["Error"]),
+        ("The following files are tagged as 'FAIL':", verdicts["Fail"]),
+    )
+    for title, records in groups:
+        if records:
+            print(title)
+            print("---------------------------------")
+            for record in records:
+                print(record.filename)
+            print("---------------------------------")
+    if results_table.count('verdict', "Pass") < len(results_table):
+        print(f"{number_of_sheets} files processed with a PASS rate of {'%.1f' % results_table.pass_rate()} %\n")
     else:
-        pass_rate = (number_of_sheets - fails)/number_of_sheets * 100
-        print(f"All {number_of_sheets} files are tagged as 'PASS'\n") 
+        print(f"All {number_of_sheets} files are tagged as 'PASS'\n")
 
-def create_doc():
-    """Creates a word-document with a table showing data about each analysed text file"""
+def new_report():
+    """Returns a new word-document and its results table with only the header row"""
 
+    from docx import Document
     date_now = datetime.today().strftime(f'%d.%m.%Y')
     document = Document()
 
     document.add_paragraph(date_now)
-    table = document.add_table(rows=number_of_sheets+1, cols=5)
+    table = document.add_table(rows=1, cols=5 if surface_distance is None else 7)
     table.style = document.styles['Medium Shading 1 Accent 1']
     header_cells = table.rows[0].cells
     header_cells[0].text = 'Filename'
@@ -307,134 +179,344 @@ def create_doc():
     header_cells[2].text = 'Minimum Distance [mm]'
     header_cells[3].text = 'M2/M1 Ratio [%]'
     header_cells[4].text = "Result"
-    row = 1
-    for key, value in file_dict.items():
-        ws = wb[f"{os.path.basename(key)}"]
-        ws3 = wb3[f"{os.path.basename(key)}"]
-        this_row = table.rows[row].cells
-        step_m = ws['J11'].value
-        step_mm = float(round(step_m, 4)) * 1000
-        m2_m1_ratio = ws3['Z6'].value  
-        rounded_ratio = float(round(m2_m1_ratio, 1))
-        min_dist = round(ws3['Z12'].value,2)
-        this_row[0].text = ws['J14'].value
-        this_row[1].text = str(step_mm)
-        this_row[2].text = str(min_dist)
-        this_row[3].text = str(rounded_ratio)
-        if value == "Fail":
-            this_row[4].text = "Fail"
-        if value == "Pass":
-            this_row[4].text = "Pass"
-        if value == "Error":
-            this_row[4].text = "Error"
-        row += 1
-        table.autofit = True
+    if surface_distance is not None:
+        header_cells[5].text = '1 g SAR [W/kg]'
+        header_cells[6].text = '10 g SAR [W/kg]'
+    return document, table
+
+def average_text(value, unit=""):
+    """Peak average SAR rounded for the report and log, "-" when the cube does not fit in the scan"""
+
+    return "-" if value is None or value != value else f"{round(value, 3)}{unit}"
+
+def report_row(record):
+    """Row of the word-document table for one analysed text file (a result_table.ScanResult)"""
+
+    step_mm = float(round(record.step, 4)) * 1000
+    rounded_ratio = float(round(record.ratio, 1))
+    min_dist = round(record.min_distance,2)
+    row = [record.filename, step_mm, min_dist, rounded_ratio, record.verdict]
+    if surface_distance is not None:
+        row += [average_text(record.sar_1g), average_text(record.sar_10g)]
+    return row
+
+def log_line(record):
+    """Line of log.txt for one analysed text file, after the result and its number"""
+
+    step_mm = float(round(record.step, 4)) * 1000
+    rounded_ratio = float(round(record.ratio, 1)) 
+    min_dist = round(record.min_distance,2)
+    line = f"{record.filename} || Step: {step_mm} mm || M2/M1 Ratio: {rounded_ratio}% || Minimum distance: {min_dist} mm"
+    if surface_distance is not None:
+        line += f" || 1 g SAR: {average_text(record.sar_1g, ' W/kg')} || 10 g SAR: {average_text(record.sar_10g, ' W/kg')}"
+    return line + "\n"
+
+def create_doc():
+    """Creates a word-document with a table showing data about each analysed text file"""
+
+    from docx.shared import Cm
+    import report_table
+    document, table = new_report()
+    report_table.add_rows(table, [report_row(record) for record in results_table])
+    table.autofit = True
 
     for cell in table.columns[0].cells:
         cell.width = Cm(6)
-    document.save(doc_name)
+    document.save(os.path.join(workspace, doc_name))
 
 def create_log_file():
     """Creates a log.txt file with statistics about each analysed file.
     Files with step size errors showed on top of list, with fails 2nd and passes 3rd."""
 
-    log_file = open(log_file_name, "w")
-    log_file.write(f"{number_of_sheets} files processed with a PASS rate of {'%.1f' % pass_rate} %\r\n")
+    log_file = open(os.path.join(workspace, log_file_name), "w")
+    log_file.write(f"{number_of_sheets} files processed with a PASS rate of {'%.1f' % results_table.pass_rate()} %\r\n")
     log_file.write(f"Date: {current_time} \r\n")
-    fail_num = 0
-    pass_num = 0
-    error_num = 0
-    for key, value in file_dict.items():
-        if value == "Error":
-            ws = wb[f"{os.path.basename(key)}"]
-            ws3 = wb3[f"{os.path.basename(key)}"]
-            error_num += 1
-            sheet_title = f"ERROR {error_num}"
-            ws.title = sheet_title
-            log_file.write(f"ERROR {error_num}: ")
-            filename = ws['J14'].value
-            log_file.write(f"{filename} || ")
-            step_m = ws['J11'].value
-            step_mm = float(round(step_m, 4)) * 1000
-            m2_m1_ratio = ws3['Z6'].value  
-            rounded_ratio = float(round(m2_m1_ratio, 1)) 
-            min_dist = round(ws3['Z12'].value,2)
-            log_file.write(f"Step: {step_mm} mm || M2/M1 Ratio: {rounded_ratio}% || Minimum distance: {min_dist} mm\n")
-    log_file.write("\n")
-    for key, value in file_dict.items():
-        if value == "Fail":
-            ws = wb[f"{os.path.basename(key)}"]
-            ws3 = wb3[f"{os.path.basename(key)}"]
-            fail_num += 1
-            sheet_title = f"FAIL {fail_num}"
-            ws.title = sheet_title
-            log_file.write(f"FAIL {fail_num}: ")
-            filename = ws['J14'].value
-            log_file.write(f"{filename} || ")
-            step_m = ws['J11'].value
-            step_mm = float(round(step_m, 4)) * 1000
-            m2_m1_ratio = ws3['Z6'].value  
-            rounded_ratio = float(round(m2_m1_ratio, 1)) 
-            min_dist = round(ws3['Z12'].value,2)
-            log_file.write(f"Step: {step_mm} mm || M2/M1 Ratio: {rounded_ratio}% || Minimum distance: {min_dist} mm\n")
-    log_file.write("\n")
-    for key, value in file_dict.items():
-        if value == "Pass":
-            ws = wb[f"{os.path.basename(key)}"]
-            ws3 = wb3[f"{os.path.basename(key)}"]
-            pass_num += 1
-            sheet_title = f"PASS {pass_num}"
-            ws.title = sheet_title
-            filename = ws['J14'].value
-            log_file.write(f"PASS {pass_num}: ")
-            log_file.write(f"{filename} || ")
-            step_m = ws['J11'].value
-            step_mm = float(round(step_m, 4)) * 1000
-            m2_m1_ratio = ws3['Z6'].value  
-            rounded_ratio = float(round(m2_m1_ratio, 1)) 
-            min_dist = round(ws3['Z12'].value,2)
-            log_file.write(f"Step: {step_mm} mm || M2/M1 Ratio: {rounded_ratio}% || Minimum distance: {min_dist} mm\n")
+    for verdict, records in results_table.by_verdict().items():
+        for number, record in enumerate(records, 1):
+            log_file.write(f"{verdict.upper()} {number}: {log_line(record)}")
+        if verdict != "Pass":
+            log_file.write("\n")
     log_file.close()
 
-def move_files():
-    """Moves all files (data files, log.txt, word-doc, excel-file) under dir_name and sub_dir_path."""
+def move_atomic(source, destination):
+    """Moves source to destination so that destination is never seen half-written. Across file systems the
+    file is first copied next to destination and then renamed"""
 
-    dir_name = 'SEMCAD_data'
-    if not os.path.exists(dir_name):
-        os.mkdir(dir_name)
-        print("Directory" , dir_name , "created")
-    sub_dir_path = os.path.join(path,dir_name,sub_dir_name)
-    os.mkdir(sub_dir_path)
+    try:
+        os.replace(source, destination)
+    except OSError:
+        atomic_files.replace_atomic(destination, lambda part: shutil.copy2(source, part))
+        os.remove(source)
+
+def unique_path(directory, name, extension):
+    """Path of name + extension in directory, with _2, _3... added if the file already exists"""
+
+    candidate = os.path.join(directory, name + extension)
+    number = 1
+    while os.path.exists(candidate):
+        number += 1
+        candidate = os.path.join(directory, f"{name}_{number}{extension}")
+    return candidate
+
+def claim_file(f, directory):
+    """Moves f into directory with a rename, which is atomic, so each export is taken by one run only even
+    when several runs share the folder. Returns the new path, or None if another run took the file first"""
+
+    destination = unique_path(directory, *os.path.splitext(os.path.basename(f)))
+    try:
+        os.rename(f, destination)
+    except FileNotFoundError:
+        return None
+    except OSError as error:
+        if error.errno != errno.EXDEV:
+            raise
+        try:    # inbox on another drive, copied instead of renamed
+            move_atomic(f, destination)
+        except FileNotFoundError:
+            return None
+    return destination
+
+def claim_files():
+    """Creates the workspace of this run under data_dir and moves the exports of all_files into it.
+    Exports already taken by another run are left out of this run"""
+
+    global workspace, all_files, number_of_sheets
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir, exist_ok=True)
+        print("Directory" , os.path.basename(data_dir) , "created")
+    workspace = os.path.join(data_dir, f".{sub_dir_name}_{uuid.uuid4().hex[:8]}")
+    os.mkdir(workspace)
+    claimed = []
+    for f in all_files:
+        if os.path.basename(f) in ignore_list:
+            continue
+        claimed_file = claim_file(f, workspace)
+        if claimed_file is not None:
+            claimed.append(claimed_file)
+    all_files = claimed
+    number_of_sheets = len(all_files)
+
+def release_files():
+    """Moves the exports of a run that failed back to the folder and removes its workspace with the
+    reports written so far"""
+
+    outputs = {excel_file_name, doc_name, log_file_name}
+    for name in os.listdir(workspace):
+        if name not in outputs:
+            claim_file(os.path.join(workspace, name), path)
+    shutil.rmtree(workspace, ignore_errors=True)
+
+def publish_run():
+    """Renames the workspace to data_dir/run_id. Other runs see the run folder only when it is complete,
+    and a run started in the same second gets a numbered folder instead of files mixed into this one"""
+
+    global run_id
     print("Moving files to subdirectory...\n")
-
-    log_path = path + "/" + log_file_name
-    excel_path = path + "/" + excel_file_name
-    doc_path = path + "/" + doc_name
-    
-    txt_files = glob.glob(os.path.join(path, "*.txt"))
-    for txt_file in txt_files:     # move all .txt files in the list to specified subdirectory
-        shutil.move(txt_file, sub_dir_path)
-    shutil.move(os.path.basename(excel_path), sub_dir_path)
-    shutil.move(os.path.basename(doc_path), sub_dir_path)
-    #print ('The script took {0} seconds !'.format(time.time() - start_time))
-
-create_excel()
-
-wb = xl.load_workbook(excel_file_name)
-fill_excel_phase_one()
-
-open_excel_in_background(excel_file_name)
-wb2 = xl.load_workbook(excel_file_name, data_only=True)
-fill_excel_phase_two()
-
-open_excel_in_background(excel_file_name)
-wb3 = xl.load_workbook(excel_file_name, data_only=True)
-fill_excel_phase_three()
-
-print_results()
-create_doc()
-create_log_file()
-move_files()
-
-exit_script = input("Press Enter to exit the script \n")
-print("Exiting...")
\ No newline at end of file
+    number = 1
+    while True:
+        run_id = sub_dir_name if number == 1 else f"{sub_dir_name}_{number}"
+        run_dir = os.path.join(data_dir, run_id)
+        try:
+            os.rename(workspace, run_dir)
+            return run_dir
+        except OSError:
+            if not os.path.exists(run_dir):
+                raise
+            number += 1
+
+def handle_export(f, session_dir):
+    """Evaluates one export in watch mode, moves it to session_dir with the name from its header, adds it to
+    results_table and its line to the log of the session. Returns its record, or None if another session took
+    the export or it could not be read. Exports that can not be read are moved under unreadable"""
+
+    incoming_dir = os.path.join(session_dir, ".incoming")
+    os.makedirs(incoming_dir, exist_ok=True)
+    incoming = claim_file(f, incoming_dir)
+    if incoming is None:    # handled by another session watching the same inbox
+        return None
+    try:
+        results = zoomscan.evaluate_file(incoming, allowed_step_sizes, store_dir, surface_distance)
+    except Exception as error:
+        unreadable_dir = os.path.join(session_dir, "unreadable")
+        os.makedirs(unreadable_dir, exist_ok=True)
+        os.rename(incoming, unique_path(unreadable_dir, *os.path.splitext(os.path.basename(f))))
+        print(f"Error handling file: {os.path.basename(f)} ({error}) -> Make all sure SAR field exports are exported with headers")
+        return None
+    destination = unique_path(session_dir, results['filename'], ".txt")
+    os.rename(incoming, destination)
+    record = result_table.ScanResult.from_results(destination, results)
+    results_table.append(record)
+    with open(os.path.join(session_dir, log_file_name), "a") as log_file:
+        log_file.write(f"{record.verdict.upper()}: {log_line(record)}")
+    print(f"{record.filename}: {record.verdict}")
+    return record
+
+def add_report_rows(session_dir, records):
+    """Adds the rows of one round of exports to the Report.docx of the session, saved once per round"""
+
+    from docx import Document
+    from docx.shared import Cm
+    import report_table
+    report_path = os.path.join(session_dir, doc_name)
+    if os.path.exists(report_path):
+        document = Document(report_path)
+        table = document.tables[0]
+    else:
+        document, table = new_report()
+    report_table.add_rows(table, [report_row(record) for record in records])
+    for row in table.rows[-len(records):]:
+        row.cells[0].width = Cm(6)
+    atomic_files.replace_atomic(report_path, document.save)
+
+def write_session_excel(session_dir):
+    """Writes results.xlsx of all exports handled in the watch session so far"""
+
+    from . import audit_workbook
+    excel_path = os.path.join(session_dir, excel_file_name)
+    atomic_files.replace_atomic(excel_path, lambda part: audit_workbook.write_workbook(part, workbook_sheets(), store_dir))
+
+def release_incoming(session_dir, inbox):
+    """Moves exports that were being handled when watch mode stopped back to inbox for the next session"""
+
+    incoming_dir = os.path.join(session_dir, ".incoming")
+    if not os.path.isdir(incoming_dir):
+        return
+    for name in os.listdir(incoming_dir):
+        if claim_file(os.path.join(incoming_dir, name), inbox) is not None:
+            print(f"{name} was not handled, moved back to {inbox}")
+    os.rmdir(incoming_dir)
+
+def stop_on_sigterm(signum, frame):
+    raise KeyboardInterrupt   # a service manager stopping watch mode is handled like Ctrl+C
+
+def watch_inbox(inbox):
+    """Watch mode: polls inbox for new .txt exports and handles each one as soon as it has stopped changing,
+    instead of processing the whole folder at once. Results of the session are collected under
+    SEMCAD_data/<start time>: the exports, log.txt gets a line per export and Report.docx the rows of each
+    round of new exports. results.xlsx of all exports of the session is rewritten at most every excel_interval
+    seconds, so handling a new export does not get slower as the session grows, and once more when the session
+    stops. Runs until stopped with Ctrl+C or SIGTERM"""
+
+    global run_id
+    os.makedirs(data_dir, exist_ok=True)
+    number = 1
+    while True:     # mkdir is atomic, a name taken by another session gets a number
+        run_id = sub_dir_name if number == 1 else f"{sub_dir_name}_{number}"
+        session_dir = os.path.join(data_dir, run_id)
+        try:
+            os.mkdir(session_dir)
+            break
+        except FileExistsError:
+            number += 1
+    seen = {}   # {export, (size, modification time)} at the previous poll
+    records = []    # handled exports of the current round, not yet in Report.docx
+    excel_rows = 0  # exports in the last results.xlsx written
+    excel_time = time.time()
+    previous_handler = signal.signal(signal.SIGTERM, stop_on_sigterm)
+    print(f"Watching {inbox} for SEMCAD exports, results go to {session_dir}. Press Ctrl+C to stop")
+    try:
+        while True:
+            current = {}
+            for f in sorted(glob.glob(os.path.join(inbox, "*.txt"))):
+                if os.path.basename(f) in ignore_list:
+                    continue
+                try:
+                    stat = os.stat(f)
+                except FileNotFoundError:
+                    continue
+                current[f] = (stat.st_size, stat.st_mtime)
+            ready = [f for f, state in current.items()
+                     if seen.get(f) == state and time.time() - state[1] >= settle_time]
+            for f in ready:
+                record = handle_export(f, session_dir)
+                if record is not None:
+                    records.append(record)
+                del current[f]
+            seen = current
+            if records:
+                add_report_rows(session_dir, records)
+                records = []
+            if ready and cache_dir is not None:
+                export_cache.evict(cache_dir, cache_max_size)
+            if create_audit_excel and len(results_table) > excel_rows and time.time() - excel_time >= excel_interval:
+                write_session_excel(session_dir)
+                excel_rows = len(results_table)
+                excel_time = time.time()
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print(f"Stopped watching, {len(results_table)} files handled")
+    finally:    # also when watch mode stops on an error, so the session keeps what was handled
+        signal.signal(signal.SIGTERM, previous_handler)
+        release_incoming(session_dir, inbox)
+        if records:
+            add_report_rows(session_dir, records)
+        if create_audit_excel and len(results_table) > excel_rows:
+            print("Creating Excel sheets")
+            write_session_excel(session_dir)
+            print("Excel file created successfully")
+
+def analyse_folder():
+    """Runs the stages of the analysis of the .txt files in the folder and saves their timings"""
+
+    timer = stage_timer.StageTimer()
+    profiler = cProfile.Profile() if profile_run else None
+    if profiler is not None:
+        profiler.enable()
+    with timer.stage("claim", files=len(all_files)):
+        claim_files()
+    if not all_files:
+        shutil.rmtree(workspace, ignore_errors=True)
+        print("No SEMCAD exports to handle, they may have been taken by another run")
+        return
+    with timer.stage("evaluate", files=number_of_sheets) as stage:
+        evaluate_files()
+        stage['points'] = sum(results_table.column('number_of_cells'))
+
+    if create_audit_excel:
+        with timer.stage("excel", files=number_of_sheets):
+            create_excel()
+
+    with timer.stage("rename", files=number_of_sheets):
+        rename_files()
+    with timer.stage("print", files=number_of_sheets):
+        print_results()
+    with timer.stage("doc", files=number_of_sheets):
+        create_doc()
+    with timer.stage("log", files=number_of_sheets):
+        create_log_file()
+    with timer.stage("move", files=number_of_sheets):
+        sub_dir_path = publish_run()
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(sub_dir_path, "profile.prof"))
+    timer.write(os.path.join(sub_dir_path, timing_file_name), workers=number_of_workers, cache=cache_dir is not None,
+                run=run_id)
+
+def main(args=(), pause=True):
+    """Runs the whole analysis of the .txt files in the folder, or watch mode with args ["--watch", inbox].
+    pause waits for Enter at the end so the console window stays open, False when called from other code"""
+
+    global store_dir
+    store_dir = cache_dir if cache_dir is not None else tempfile.mkdtemp(prefix="sarzoom_")
+    try:
+        if args and args[0] == "--watch":   # SARzoom.py --watch [inbox], inbox defaults to this folder
+            watch_inbox(args[1] if len(args) > 1 else path)
+            return
+        try:
+            analyse_folder()
+        except BaseException:
+            if workspace is not None and os.path.isdir(workspace):    # not published, the exports are given back
+                release_files()
+            raise
+    finally:
+        if cache_dir is None:   # memory-mapped files still open on Windows are left to the temp folder cleanup
+            shutil.rmtree(store_dir, ignore_errors=True)
+
+    if pause:
+        exit_script = input("Press Enter to exit the script \n")
+    print("Exiting...")
+
+# guarded, because worker processes import this script when evaluating files in parallel
+if __name__ == "__main__":
+    main(sys.argv[1:])
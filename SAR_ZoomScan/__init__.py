@@ -0,0 +1,4 @@
+"""
+SAR zoom scan analysis: SARzoom.py runs the whole analysis of a folder of SEMCAD exports, the other modules
+are its stages (parsing, evaluation, volume averages, audit workbook) and can be imported on their own.
+"""
@@ -0,0 +1,160 @@
+import openpyxl as xl
+from openpyxl.utils import column_index_from_string
+from . import export_cache
+from . import semcad_export
+
+"""
+Writes results.xlsx for auditing the zoom scan results. The workbook has the same layout and formulas
+as before (data in columns A-E, rounded coordinates in G-H, checks in J-AE), but it is written in one
+pass with openpyxl's write-only mode: rows go straight to disk as they are created, so memory use does
+not grow with the number or size of the scans and the file is never loaded back.
+
+The values computed by zoomscan.py are written in column AB next to the matching formulas in column Z.
+"""
+
+TAB_COLORS = {"Fail": '00FF0000', "Error": '00FFFB00'}
+
+
+def _cells(*cells):
+    """Turns ('J2', value) pairs into {row: {column index: value}}"""
+
+    rows = {}
+    for coordinate, value in cells:
+        column = coordinate.rstrip("0123456789")
+        row = int(coordinate[len(column):])
+        rows.setdefault(row, {})[column_index_from_string(column)] = value
+    return rows
+
+
+def _value(value):
+    """NaN values are left as empty cells"""
+
+    return None if value != value else value
+
+
+def _fixed_cells(results):
+    """Cells of a worksheet that are not repeated for each point"""
+
+    number_of_cells = results['number_of_cells']
+    last = number_of_cells + 2
+    lowest = int(number_of_cells / results['grid_y'])
+    min_distance = _value(results['min_distance'])   # NaN when there is no point below half of peak
+    columns = results.get('columns', semcad_export.COLUMNS)
+    units = results.get('units', [])
+    header = [(f"{letter}1", name) for letter, name in zip("BCDE", columns)]
+    header += [(f"{letter}2", unit) for letter, unit in zip("BCDE", units)]
+    averages = []
+    if 'sar_1g' in results:     # peak spatial averages of volume_average.py, no formula computes these
+        averages = [('Z16', "Peak 1 g average SAR [W/kg]"), ('AB16', _value(results['sar_1g'])),
+                    ('Z18', "Peak 10 g average SAR [W/kg]"), ('AB18', _value(results['sar_10g']))]
+    return _cells(
+        *header,
+        *averages,
+        ('A2', 0),
+        ('G1', "X(m)"), ('H1', "Y(m)"), ('G2', "Rounded"), ('H2', "Rounded"),
+        ('J2', "MAX Value of SAR [W/kg]"), ('J3', f"=MAX(B3:B{last})"),
+        ('J4', "Cell number of MAX value SAR"), ('J5', "=MATCH(MAX(B:B),B:B,0)"),
+        ('J7', "Point M2 (Cell value of MAX Value SAR + 1)"), ('J8', f"=B{results['m2_row']}"),
+        ('J10', "X- & Y-axis zoom scan step size (m)"), ('J11', results['step']), ('K11', "X"),
+        ('J12', results['step_y']), ('K12', "Y"),   # an Error verdict may come from the Y step only
+        ('J13', 'filename'), ('J14', results['filename']),
+        ('J16', "Uniform measurement grid?"), ('J17', "Yes" if results['uniform_grid'] else "No"),
+        ('K3', "=(MATCH(MAX(B:B),B:B,0))+1"),
+        ('N2', "X(m)"), ('O2', "Y(m)"), ('P2', "Z(m)"),
+        ('N3', f"=INDEX(C3:C{last},MATCH(MAX(B3:B{last}),B3:B{last},0))"),
+        ('O3', f"=INDEX(D3:D{last},MATCH(MAX(B3:B{last}),B3:B{last},0))"),
+        ('P3', f"=INDEX(E3:E{last},MATCH(MAX(B3:B{last}),B3:B{last},0))"),
+        ('O9', "gx"), ('P9', "gy"), ('O10', results['grid_x']), ('P10', results['grid_y']),
+        ('R1', "Lowest measurement points:"), ('R2', "SAR"), ('S2', "X"), ('T2', "Y"),
+        ('Z2', "Is Point next to SAR peak below 3dB?"), ('Z3', f'=IF(COUNTIF(X3:X{2 + lowest},"FAIL"),"Yes","No")'),
+        ('Z5', "%-Ratio between m2 and m1: (>=30%)"), ('Z6', "=J8/J3 *100"),
+        ('Z8', "Re-measurement required?"), ('Z9', '=IF(AND(Z3="No", Z6>=30%), "No", "Yes")'),
+        ('Z11', "Minimum distance?"),
+        ('Z12', f"=SMALL(AE3:AE{lowest + 2},COUNTIF($AE$3:$AE${lowest + 2},0)+1)*1000"),
+        ('Z14', "Result"), ('AA12', "mm"),
+        ('AB2', "Computed by script"), ('AB3', results['below_3db']), ('AB6', results['ratio']),
+        ('AB9', results['remeasure']), ('AB12', min_distance), ('AB14', results['verdict']),
+        ('AE2', "Minimum distance"),
+    )
+
+
+def _lowest_point_cells(row):
+    """Formulas of the lowest measurement point columns (R-AE) on one row"""
+
+    return {
+        18: "=OFFSET($B$3,(ROW()-3)*$P$10,0)",
+        19: "=OFFSET($C$3,(ROW()-3)*$P$10,0)",
+        20: "=OFFSET($D$3,(ROW()-3)*$P$10,0)",
+        22: f"=SQRT((S{row}-$N$3)^2+(T{row}-$O$3)^2)",
+        23: f"=IF(V{row}<($J$11+($J$11/10)),TRUE,FALSE)",
+        24: f'=IF(AND(W{row}=TRUE, (R{row}/$J$3)<=0.501187),"FAIL", "PASS")',
+        31: f"=ROUND(IF(R{row}/$J$3<0.5, V{row}, 0), 4)",
+    }
+
+
+def _row(values, extra):
+    """Row list for ws.append with extra {column index: value} cells added"""
+
+    if extra:
+        values = values + [None] * (max(extra) - len(values))
+        for column, value in extra.items():
+            values[column - 1] = value
+    return values
+
+
+def iter_points(file_name, cache_dir=None, key=None):
+    """Yields the points of an export in chunks, from export_cache when cache_dir is given. With the cache_key
+    of the evaluation results the entry is opened directly, the export is not read at all"""
+
+    if cache_dir is not None:
+        try:
+            points = export_cache.open_export(cache_dir, key)['points'] if key else None
+        except OSError:     # removed from the cache since the evaluation
+            points = None
+        if points is None:
+            points = export_cache.load_export(file_name, cache_dir)['points']
+        for start in range(0, len(points), semcad_export.CHUNK_SIZE):
+            yield points[start:start + semcad_export.CHUNK_SIZE]
+        return
+    with open(file_name) as export:
+        semcad_export.read_header(export)
+        yield from semcad_export.iter_chunks(export)
+
+
+def write_sheet(ws, chunks, results):
+    """Appends the rows of one scan to a write-only worksheet"""
+
+    tab_color = TAB_COLORS.get(results['verdict'])
+    if tab_color is not None:
+        ws.sheet_properties.tabColor = tab_color
+    fixed = _fixed_cells(results)
+    lowest = int(results['number_of_cells'] / results['grid_y'])
+    ws.append(_row([], fixed.get(1)))
+    ws.append(_row([], fixed.get(2)))
+    row = 3
+    for chunk in chunks:
+        for sar, x, y, z in chunk.tolist():
+            extra = fixed.get(row, {})
+            if row - 3 < lowest:
+                extra = {**extra, **_lowest_point_cells(row)}
+            ws.append(_row([row - 2, sar, x, y, z, None,
+                            f"=ROUND(C{row}-C$3,3)+C$3", f"=ROUND(D{row}-D$3,3)+D$3"], extra))
+            row += 1
+    # fixed cells below the last point on short scans
+    for extra_row in sorted(r for r in fixed if r >= row):
+        while row < extra_row:
+            ws.append([])
+            row += 1
+        ws.append(_row([], fixed[extra_row]))
+        row += 1
+
+
+def write_workbook(excel_file_name, sheets, cache_dir=None):
+    """Writes the audit workbook. sheets is a list of (sheet title, export file name, results of
+    zoomscan.evaluate_file) tuples, worksheets are written in title order"""
+
+    wb = xl.Workbook(write_only=True)
+    for title, file_name, results in sorted(sheets, key=lambda sheet: sheet[0]):
+        ws = wb.create_sheet(title)
+        write_sheet(ws, iter_points(file_name, cache_dir, results.get('cache_key')), results)
+    wb.save(excel_file_name)
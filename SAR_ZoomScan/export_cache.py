@@ -0,0 +1,113 @@
+import json
+import os
+import numpy as np
+import atomic_files
+from . import semcad_export
+
+"""
+On-disk cache of parsed SEMCAD exports. Each export is stored under the SHA-256 hash of its contents as
+a raw float64 file (SAR, X, Y, Z rows, memory-mapped when read) and a small .json file with the header
+values. Re-running the script on unchanged exports skips text parsing completely.
+
+The .json file is written last, an entry without it is incomplete and never read. When the cache grows
+over its size limit, the least recently used entries are removed first.
+
+The memory-mapped points are also how parsed scans are handed between the stages of a run: worker processes
+parse and evaluate the exports, the main process maps the same files for the audit workbook using the
+'cache_key' of the results, so the points are neither copied between processes nor parsed or hashed again.
+"""
+
+DTYPE = np.float64
+
+
+def _entry_paths(cache_dir, key):
+    return os.path.join(cache_dir, key + ".f8"), os.path.join(cache_dir, key + ".json")
+
+
+def _open_entry(data_path, header, key):
+    scan = dict(header)
+    scan['cache_key'] = key
+    rows = scan.pop('rows')
+    if rows:
+        points = np.memmap(data_path, dtype=DTYPE, mode='r', shape=(rows, len(semcad_export.COLUMNS)))
+    else:
+        points = np.empty((0, len(semcad_export.COLUMNS)), dtype=DTYPE)
+    scan['points'] = points
+    scan['sar'], scan['x'], scan['y'], scan['z'] = points.T
+    return scan
+
+
+def store_export(file_name, cache_dir, key):
+    """Parses an export with semcad_export and writes it to the cache under key, one chunk at a time"""
+
+    os.makedirs(cache_dir, exist_ok=True)
+    data_path, header_path = _entry_paths(cache_dir, key)
+    with open(file_name) as export:
+        header = semcad_export.read_header(export)
+        header['rows'] = 0
+
+        def write_points(part):
+            with open(part, "wb") as data:
+                for chunk in semcad_export.iter_chunks(export):
+                    data.write(np.ascontiguousarray(chunk, dtype=DTYPE).tobytes())
+                    header['rows'] += len(chunk)
+
+        atomic_files.replace_atomic(data_path, write_points)
+    atomic_files.write_json(header, header_path)
+    return header
+
+
+def load_export(file_name, cache_dir):
+    """Returns an export like semcad_export.read_export, with the points memory-mapped from the cache.
+    The export is parsed and added to the cache first if its contents have not been seen before"""
+
+    key = atomic_files.file_hash(file_name)
+    data_path, header_path = _entry_paths(cache_dir, key)
+    try:
+        with open(header_path) as meta:
+            header = json.load(meta)
+        os.utime(header_path)       # marks the entry as recently used for evict
+        return _open_entry(data_path, header, key)
+    except (OSError, ValueError):   # not cached, or evicted by another run sharing the cache after the header was read
+        header = store_export(file_name, cache_dir, key)
+    return _open_entry(data_path, header, key)
+
+
+def open_export(cache_dir, key):
+    """Returns the export stored under key (the 'cache_key' of load_export) without reading the export file.
+    Raises OSError if the entry is not in the cache"""
+
+    data_path, header_path = _entry_paths(cache_dir, key)
+    with open(header_path) as meta:
+        header = json.load(meta)
+    return _open_entry(data_path, header, key)
+
+
+def evict(cache_dir, max_size):
+    """Removes least recently used entries until the cache takes at most max_size bytes"""
+
+    if not os.path.isdir(cache_dir):
+        return
+    entries = []
+    total = 0
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".json"):
+            continue
+        key = name[:-len(".json")]
+        data_path, header_path = _entry_paths(cache_dir, key)
+        try:
+            size = os.path.getsize(data_path) + os.path.getsize(header_path)
+            used = os.path.getmtime(header_path)
+        except OSError:
+            continue
+        entries.append((used, size, data_path, header_path))
+        total += size
+    for used, size, data_path, header_path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(header_path)
+            os.remove(data_path)
+        except OSError:     # entry in use by another run (memory-mapped on Windows), left for next time
+            continue
+        total -= size
@@ -0,0 +1,97 @@
+"""
+In-memory results of a SARzoom.py run. Each evaluated export is a ScanResult with the values the reports
+need, and the ResultTable keeps them by column in the order the files were handled. The console summary,
+Report.docx, log.txt and the audit workbook are all written from the table.
+"""
+
+VERDICTS = ("Error", "Fail", "Pass")    # order of the groups in the console summary and log.txt
+# other values of zoomscan.evaluate_file read by the audit workbook, the rest of the results dict is not kept
+AUDIT_FIELDS = ('step_y', 'grid_x', 'grid_y', 'm2_row', 'below_3db', 'remeasure', 'columns', 'units', 'cache_key')
+
+
+class ScanResult:
+    """Results of one zoom scan. sar_1g and sar_10g are None when the peak averages were not computed"""
+
+    __slots__ = ('file', 'filename', 'step', 'ratio', 'min_distance', 'peak', 'verdict', 'uniform_grid',
+                 'number_of_cells', 'sar_1g', 'sar_10g') + AUDIT_FIELDS
+
+    def __init__(self, file, filename, step, ratio, min_distance, peak, verdict, uniform_grid, number_of_cells,
+                 sar_1g=None, sar_10g=None, **audit):
+        self.file = file
+        self.filename = filename
+        self.step = step
+        self.ratio = ratio
+        self.min_distance = min_distance
+        self.peak = peak
+        self.verdict = verdict
+        self.uniform_grid = uniform_grid
+        self.number_of_cells = number_of_cells
+        self.sar_1g = sar_1g
+        self.sar_10g = sar_10g
+        for field in AUDIT_FIELDS:
+            setattr(self, field, audit.get(field))
+
+    @classmethod
+    def from_results(cls, file, results):
+        """Record of the results dict of zoomscan.evaluate_file for export file"""
+
+        return cls(file, results['filename'], results['step'], results['ratio'], results['min_distance'],
+                   results['peak'], results['verdict'], results['uniform_grid'], results['number_of_cells'],
+                   results.get('sar_1g'), results.get('sar_10g'),
+                   **{field: results.get(field) for field in AUDIT_FIELDS})
+
+    def as_dict(self):
+        """Results dict for audit_workbook.py, values that are None are left out like in zoomscan.evaluate_file"""
+
+        return {field: getattr(self, field) for field in self.__slots__ if getattr(self, field) is not None}
+
+    def __repr__(self):
+        return f"ScanResult({self.filename!r}, {self.verdict!r})"
+
+
+class ResultTable:
+    """Column-wise table of ScanResult rows in the order they were added"""
+
+    def __init__(self):
+        self.columns = {field: [] for field in ScanResult.__slots__}
+
+    def append(self, record):
+        for field, values in self.columns.items():
+            values.append(getattr(record, field))
+
+    def __len__(self):
+        return len(self.columns['file'])
+
+    def __getitem__(self, index):
+        return ScanResult(**{field: values[index] for field, values in self.columns.items()})
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+    def column(self, field):
+        return self.columns[field]
+
+    def set(self, index, field, value):
+        self.columns[field][index] = value
+
+    def count(self, field, value):
+        return self.columns[field].count(value)
+
+    def where(self, field, value):
+        """Rows whose field equals value, in table order"""
+
+        return [self[index] for index, item in enumerate(self.columns[field]) if item == value]
+
+    def by_verdict(self):
+        """Rows of each verdict from one pass over the table, {verdict: rows} in VERDICTS order with table
+        order inside each group"""
+
+        groups = {verdict: [] for verdict in VERDICTS}
+        for index, verdict in enumerate(self.columns['verdict']):
+            groups.setdefault(verdict, []).append(self[index])
+        return groups
+
+    def pass_rate(self):
+        """Percentage of files tagged as Pass"""
+
+        return self.count('verdict', "Pass") / len(self) * 100 if len(self) else 0.0
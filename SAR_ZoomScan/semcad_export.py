@@ -0,0 +1,63 @@
+import numpy as np
+
+"""
+Streaming reader for SEMCAD field exports. The header and the measurement points are read in one
+pass over the file and the points are handed out as chunks of typed arrays, so a file never has to
+be loaded into memory as text.
+
+Layout of a SEMCAD field export (headers enabled):
+    line 3: path of the simulation, name of the file is between "/Program/" and the next "/"
+    line 4: "Grid: <gx>x<?>x<gy>", gy is the number of points per measurement column
+    line 5: column names, line 6: units, after that data rows of SAR, X, Y, Z separated by double tabs
+Data rows with "--" values are ignored.
+pandas is imported when a file is first read, exports found in the export cache do not need it.
+"""
+
+HEADER_LINES = 6        # header lines before the first data row, including column names and units
+CHUNK_SIZE = 65536      # data rows per chunk, memory use of a chunk is CHUNK_SIZE * 4 * 8 bytes
+COLUMNS = ["SAR", "X", "Y", "Z"]
+
+
+def read_header(export):
+    """Reads the header lines of an open export file and returns a dict with the file name between
+    "/Program/" and "/", the grid values and the column names and units.
+    Raises IndexError if the file was exported without headers"""
+
+    lines = [export.readline() for _ in range(HEADER_LINES)]
+    program_name = lines[2].split("/Program/")[1].split("/")[0]
+    grid_values = lines[3].split("Grid: ")[1].split("x")
+    return {
+        'filename': program_name,
+        'grid_x': float(grid_values[0]),
+        'grid_y': float(grid_values[2]),
+        'columns': lines[4].rstrip("\n").split("\t\t"),
+        'units': lines[5].rstrip("\n").split("\t\t"),
+    }
+
+
+def iter_chunks(export, chunk_size=CHUNK_SIZE):
+    """Yields the data rows of an open export file, positioned after the header, as float arrays
+    with SAR, X, Y and Z columns. At most chunk_size rows are held in memory at a time"""
+
+    import pandas as pd
+    reader = pd.read_csv(export, sep=r"\s+", header=None, names=COLUMNS, usecols=range(len(COLUMNS)),
+                         na_values=['--'], dtype=np.float64, float_precision='round_trip',
+                         chunksize=chunk_size)
+    with reader:
+        for df in reader:
+            points = df.dropna().to_numpy(dtype=np.float64)
+            if len(points):
+                yield points
+
+
+def read_export(file_name, chunk_size=CHUNK_SIZE):
+    """Reads a whole export and returns its header dict with SAR/X/Y/Z point arrays added.
+    The arrays are columns of one contiguous array stored under 'points'"""
+
+    with open(file_name) as export:
+        scan = read_header(export)
+        chunks = list(iter_chunks(export, chunk_size))
+    points = np.concatenate(chunks) if chunks else np.empty((0, len(COLUMNS)))
+    scan['points'] = points
+    scan['sar'], scan['x'], scan['y'], scan['z'] = points.T
+    return scan
@@ -0,0 +1,111 @@
+import numpy as np
+
+"""
+Bucket grid index over the X/Y coordinates of measurement points. Points are sorted by the grid cell
+they fall in, so a radius or nearest point query only looks at the cells around the query point
+instead of every point of the scan. Used by zoomscan.py for the checks around the SAR peak.
+"""
+
+
+class GridIndex:
+    """Index over points (x, y) with square cells of cell_size. Distances are computed the same way as in
+    the workbook: SQRT((x-px)^2+(y-py)^2)"""
+
+    def __init__(self, x, y, cell_size=None):
+        self.x = np.asarray(x, dtype=float)
+        self.y = np.asarray(y, dtype=float)
+        if len(self.x) == 0:
+            self.origin = (0.0, 0.0)
+            self.cell_size = 1.0
+            self.shape = (0, 0)
+            self.order = np.empty(0, dtype=np.intp)
+            self.starts = np.zeros(1, dtype=np.intp)
+            return
+        self.origin = (float(self.x.min()), float(self.y.min()))
+        width = float(self.x.max()) - self.origin[0]
+        height = float(self.y.max()) - self.origin[1]
+        if not cell_size or cell_size <= 0:
+            # about one point per cell on a uniform grid
+            cell_size = max(width, height) / max(np.sqrt(len(self.x)) - 1, 1) or 1.0
+        self.cell_size = float(cell_size)
+        self.shape = (int(width // self.cell_size) + 1, int(height // self.cell_size) + 1)
+        cells = self._cell_numbers(self._cell_x(self.x), self._cell_y(self.y))
+        self.order = np.argsort(cells, kind='stable')
+        # points of cell c are order[starts[c]:starts[c + 1]]
+        self.starts = np.searchsorted(cells[self.order], np.arange(self.shape[0] * self.shape[1] + 1))
+
+    def __len__(self):
+        return len(self.x)
+
+    def _cell_x(self, x):
+        return np.clip(((x - self.origin[0]) // self.cell_size).astype(np.intp), 0, self.shape[0] - 1)
+
+    def _cell_y(self, y):
+        return np.clip(((y - self.origin[1]) // self.cell_size).astype(np.intp), 0, self.shape[1] - 1)
+
+    def _cell_numbers(self, cell_x, cell_y):
+        return cell_x * self.shape[1] + cell_y
+
+    def _points_in_cells(self, first_x, last_x, first_y, last_y):
+        """Returns indices of points in the cells of the given (inclusive) cell ranges"""
+
+        first_x, first_y = max(first_x, 0), max(first_y, 0)
+        last_x, last_y = min(last_x, self.shape[0] - 1), min(last_y, self.shape[1] - 1)
+        if first_x > last_x or first_y > last_y:
+            return np.empty(0, dtype=np.intp)
+        slices = []
+        for cell_x in range(first_x, last_x + 1):
+            # cells of one column are consecutive, so each column is one slice
+            start = self.starts[self._cell_numbers(cell_x, first_y)]
+            stop = self.starts[self._cell_numbers(cell_x, last_y) + 1]
+            slices.append(self.order[start:stop])
+        return np.concatenate(slices)
+
+    def distances(self, indices, px, py):
+        """Distances from point (px, py) to the indexed points at indices"""
+
+        return np.sqrt((self.x[indices] - px) ** 2 + (self.y[indices] - py) ** 2)
+
+    def within(self, px, py, radius):
+        """Returns indices of points closer than radius to (px, py)"""
+
+        if len(self) == 0 or radius <= 0:
+            return np.empty(0, dtype=np.intp)
+        candidates = self._points_in_cells(
+            int((px - radius - self.origin[0]) // self.cell_size), int((px + radius - self.origin[0]) // self.cell_size),
+            int((py - radius - self.origin[1]) // self.cell_size), int((py + radius - self.origin[1]) // self.cell_size))
+        return candidates[self.distances(candidates, px, py) < radius]
+
+    def nearest(self, px, py, accept=None):
+        """Returns (index, distance) of the point closest to (px, py), or (None, None) if there is none.
+        accept is an optional function taking an array of distances and returning which of them are allowed"""
+
+        if len(self) == 0:
+            return None, None
+        center_x = int((px - self.origin[0]) // self.cell_size)
+        center_y = int((py - self.origin[1]) // self.cell_size)
+        best_index, best_distance = None, None
+        max_ring = max(abs(center_x), abs(center_y), abs(self.shape[0] - center_x), abs(self.shape[1] - center_y)) + 1
+        for ring in range(max_ring + 1):
+            if ring == 0:
+                candidates = self._points_in_cells(center_x, center_x, center_y, center_y)
+            else:
+                # cells on the border of a square of (2 * ring + 1) cells around the query cell
+                candidates = np.concatenate((
+                    self._points_in_cells(center_x - ring, center_x - ring, center_y - ring, center_y + ring),
+                    self._points_in_cells(center_x + ring, center_x + ring, center_y - ring, center_y + ring),
+                    self._points_in_cells(center_x - ring + 1, center_x + ring - 1, center_y - ring, center_y - ring),
+                    self._points_in_cells(center_x - ring + 1, center_x + ring - 1, center_y + ring, center_y + ring)))
+            if candidates.size:
+                distances = self.distances(candidates, px, py)
+                if accept is not None:
+                    allowed = accept(distances)
+                    candidates, distances = candidates[allowed], distances[allowed]
+                if distances.size:
+                    closest = int(np.argmin(distances))
+                    if best_distance is None or distances[closest] < best_distance:
+                        best_index, best_distance = int(candidates[closest]), float(distances[closest])
+            # points in the next rings are at least ring * cell_size away from the query point
+            if best_distance is not None and best_distance <= ring * self.cell_size:
+                break
+        return best_index, best_distance
@@ -0,0 +1,76 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+try:
+    import resource
+except ImportError:     # not available on Windows, peak memory is left out of the report
+    resource = None
+
+"""
+Timing of the stages of a SARzoom.py run. Each stage records its wall time, CPU time (including worker
+processes that have finished) and the peak resident memory of the script and its workers after the stage,
+along with counts such as the number of files. The report is written as JSON so runs can be compared.
+"""
+
+
+def _peak_rss():
+    """Returns (peak RSS of this process, peak RSS of the largest finished child process) in bytes or Nones"""
+
+    if resource is None:
+        return None, None
+    scale = 1 if sys.platform == "darwin" else 1024     # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+    return (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale)
+
+
+def _cpu_time():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class StageTimer:
+    """Collects the timings of named stages, use as: with timer.stage("evaluate", files=10) as stage: ...
+    Counts known only at the end of a stage can be added to the yielded dict"""
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.stages = []
+        self._wall_start = time.perf_counter()
+        self._cpu_start = _cpu_time()
+
+    @contextmanager
+    def stage(self, name, **counts):
+        record = {'name': name, **counts}
+        wall_start = time.perf_counter()
+        cpu_start = _cpu_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall_start
+            record['cpu_s'] = _cpu_time() - cpu_start
+            record['peak_rss_bytes'], record['peak_rss_children_bytes'] = _peak_rss()
+            self.stages.append(record)
+
+    def report(self, **info):
+        """Dict of all stages and the totals of the run, info is added as is (e.g. number of workers)"""
+
+        peak_rss, peak_rss_children = _peak_rss()
+        return {
+            'started': self.started.isoformat(timespec='seconds'),
+            'python': sys.version.split()[0],
+            **info,
+            'total': {
+                'wall_s': time.perf_counter() - self._wall_start,
+                'cpu_s': _cpu_time() - self._cpu_start,
+                'peak_rss_bytes': peak_rss,
+                'peak_rss_children_bytes': peak_rss_children,
+            },
+            'stages': self.stages,
+        }
+
+    def write(self, file_name, **info):
+        with open(file_name, "w") as report_file:
+            json.dump(self.report(**info), report_file, indent=2)
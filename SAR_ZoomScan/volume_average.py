@@ -0,0 +1,139 @@
+import math
+import numpy as np
+
+"""
+Peak spatial-average SAR over 1 g and 10 g cubes from the whole zoom scan volume. The measurement points
+(SAR, X, Y, Z) are put back on their 3D grid, resampled with trilinear interpolation to a fine grid of nearly
+cubic voxels that fills the volume exactly and, if the phantom surface is below the lowest measurement layer,
+extrapolated down to it. The average
+over every cube position inside the volume is then taken from a 3D cumulative sum (integral image), so each
+file needs one linear-time pass per cube size however many positions there are. Grid positions without a
+measurement ("--" rows of the export) are not guessed: a second cumulative sum over the voxels interpolated
+from them leaves out every cube that contains one.
+
+The lowest measurement layer is the one of the first point of each column (see zoomscan.py), depths are
+measured from it towards the other layers whether Z grows or shrinks upwards in the export.
+"""
+
+TISSUE_DENSITY = 1000   # kg/m^3, cube side is (mass / density) ** (1/3)
+CUBE_MASSES = {'1g': 0.001, '10g': 0.01}    # kg
+MAX_VOXEL_SIZE = 0.001  # m, about the largest side of the interpolated voxels
+COORDINATE_DECIMALS = 5     # coordinates are rounded to 0.01 mm when the grid is rebuilt
+
+
+def cube_side(mass):
+    """Side of a cube of tissue of mass (kg) in metres"""
+
+    return (mass / TISSUE_DENSITY) ** (1 / 3)
+
+
+def volume_grid(points):
+    """Puts points (rows of SAR, X, Y, Z) back on their grid. Returns (volume, missing, x, y, depth, z0, direction):
+    volume[i, j, k] is the SAR at x[i], y[j] and depth[k] from the lowest layer, at Z = z0 + direction * depth.
+    missing is True at grid positions without a point (rows of "--" in the export), volume is 0 there"""
+
+    sar = points[:, 0]
+    x, x_index = np.unique(np.round(points[:, 1], COORDINATE_DECIMALS), return_inverse=True)
+    y, y_index = np.unique(np.round(points[:, 2], COORDINATE_DECIMALS), return_inverse=True)
+    z = np.round(points[:, 3], COORDINATE_DECIMALS)
+    z0 = float(z[0])
+    direction = -1.0 if len(z) and z0 == z.max() and z0 != z.min() else 1.0
+    depth, depth_index = np.unique((z - z0) * direction, return_inverse=True)
+    volume = np.zeros((len(x), len(y), len(depth)))
+    missing = np.ones(volume.shape, dtype=bool)
+    measured = ~np.isnan(sar)
+    volume[x_index[measured], y_index[measured], depth_index[measured]] = sar[measured]
+    missing[x_index[measured], y_index[measured], depth_index[measured]] = False
+    return volume, missing, x, y, depth, z0, direction
+
+
+def resample(volume, axis, coordinates, new_coordinates):
+    """Linear interpolation of volume along axis from coordinates to new_coordinates, values outside
+    the coordinates are extrapolated from the two nearest ones"""
+
+    lower = np.clip(np.searchsorted(coordinates, new_coordinates, side='right') - 1, 0, len(coordinates) - 2)
+    weights = (new_coordinates - coordinates[lower]) / (coordinates[lower + 1] - coordinates[lower])
+    shape = [1] * volume.ndim
+    shape[axis] = -1
+    weights = weights.reshape(shape)
+    below = np.take(volume, lower, axis=axis)
+    return below + (np.take(volume, lower + 1, axis=axis) - below) * weights
+
+
+def voxel_centres(start, stop, size):
+    """Centres and side of the voxels that fill start...stop exactly, with the side closest to size, so
+    cubes can reach both ends of the scan"""
+
+    count = max(1, round((stop - start) / size))
+    size = (stop - start) / count
+    return start + size / 2 + np.arange(count) * size, size
+
+
+def cube_sums(volume, n):
+    """Sums over all positions of a cube of n x n x n voxels from one cumulative sum: each is 8 lookups by
+    inclusion-exclusion. sums[i, j, k] is the cube whose first voxel is volume[i, j, k]"""
+
+    total = np.zeros(tuple(size + 1 for size in volume.shape))
+    total[1:, 1:, 1:] = volume.cumsum(0).cumsum(1).cumsum(2)
+    return (total[n:, n:, n:] - total[:-n, n:, n:] - total[n:, :-n, n:] - total[n:, n:, :-n]
+            + total[:-n, :-n, n:] + total[:-n, n:, :-n] + total[n:, :-n, :-n] - total[:-n, :-n, :-n])
+
+
+def peak_cube_average(volume, n, invalid=None):
+    """Largest average over cubes of n x n x n voxels and the index of the first voxel of that cube,
+    or (nan, None) if the volume is smaller than the cube. Cubes with a True voxel in the optional
+    invalid mask are left out, (nan, None) is returned also if no cube is left"""
+
+    if min(volume.shape) < n:
+        return float('nan'), None
+    sums = cube_sums(volume, n)
+    if invalid is not None and invalid.any():
+        sums[cube_sums(invalid.astype(np.float64), n) > 0.5] = -np.inf   # counts of invalid voxels in each cube
+        if np.isneginf(sums).all():
+            return float('nan'), None
+    peak = np.unravel_index(int(np.argmax(sums)), sums.shape)
+    return float(sums[peak]) / n ** 3, peak
+
+
+def peak_averages(points, surface_distance=0.0, masses=CUBE_MASSES, max_voxel_size=MAX_VOXEL_SIZE):
+    """Peak spatial-average SAR of a zoom scan for each cube mass. surface_distance (m) is the distance from the
+    phantom surface to the lowest measurement layer, the volume is extrapolated over it. Returns a dict with
+    'sar_<name>' (W/kg, nan if the scan is too small for the cube, not 3D or every cube position has a voxel
+    interpolated from a missing point) and 'cube_<name>' (X, Y, Z of the cube centre or None) for each name in masses"""
+
+    results = {}
+    for name in masses:
+        results[f'sar_{name}'] = float('nan')
+        results[f'cube_{name}'] = None
+    if len(points) == 0:
+        return results
+    volume, missing, x, y, depth, z0, direction = volume_grid(points)
+    if min(volume.shape) < 2:   # an area scan or a single column can not be averaged over a volume
+        return results
+
+    for name, mass in masses.items():
+        side = cube_side(mass)
+        if min(x[-1] - x[0], y[-1] - y[0], depth[-1] + surface_distance) < side * (1 - 1e-9):
+            continue    # the cube does not fit in the volume
+        n = math.ceil(side / max_voxel_size - 1e-9)     # voxels of a cube side
+        # each axis is split into whole voxels of about side / n, so a cube of n voxels can reach both of its ends
+        fine_x, size_x = voxel_centres(x[0], x[-1], side / n)
+        fine_y, size_y = voxel_centres(y[0], y[-1], side / n)
+        fine_depth, size_depth = voxel_centres(-surface_distance, depth[-1], side / n)
+        fine = resample(volume, 0, x, fine_x)
+        fine = resample(fine, 1, y, fine_y)
+        fine = np.maximum(resample(fine, 2, depth, fine_depth), 0)  # extrapolation may go below 0
+        invalid = None
+        if missing.any():   # a voxel is invalid if a missing point has any weight in its interpolation
+            invalid = resample(missing.astype(np.float64), 0, x, fine_x)
+            invalid = resample(invalid, 1, y, fine_y)
+            invalid = resample(invalid, 2, depth, fine_depth) != 0
+        average, first = peak_cube_average(fine, n, invalid)
+        if first is None:
+            continue
+        centre_depth = fine_depth[first[2]] + size_depth * (n - 1) / 2
+        results[f'sar_{name}'] = average
+        results[f'cube_{name}'] = (float(fine_x[first[0]] + size_x * (n - 1) / 2),
+                                   float(fine_y[first[1]] + size_y * (n - 1) / 2),
+                                   float(z0 + direction * centre_depth))
+    return results
@@ -0,0 +1,222 @@
+import numpy as np
+from . import export_cache
+from . import semcad_export
+from . import volume_average
+from .spatial_index import GridIndex
+
+"""
+Evaluation engine for SAR zoom scans. Computes the values that used to be read back from Excel
+formulas after recalculation (J3, J8, J11, N3:P3, Z3, Z6, Z9 and Z12 in results.xlsx) straight from
+the point arrays of a SEMCAD export, so no Excel instance is needed to get the PASS/FAIL verdicts.
+
+Points are gone through once in chunks (see semcad_export.py) and only the peak, M2 value, step size
+and the lowest measurement layer are kept, so memory use depends on the lowest layer, not the file size.
+Peak 1 g / 10 g averages (volume_average.py) need the whole volume, so when they are asked for the points
+of the file are kept as well.
+"""
+
+ALLOWED_STEP_SIZES = [0.0075, 0.004, 0.005]   # m, used by SARzoom.py and verkotan.py, add new step sizes here
+SAR_3DB_RATIO = 0.501187    # -3 dB as a linear ratio, used for the points next to SAR peak
+MIN_DISTANCE_RATIO = 0.5    # points below this share of peak SAR are used for minimum distance
+M2_M1_LIMIT = 30 / 100      # Excel formula compares Z6 (in percents) against 30%, kept as is
+
+
+def excel_round(values, digits):
+    """Rounds like Excel ROUND: half away from zero, using the 15 significant digits Excel works with"""
+
+    values = np.asarray(values, dtype=float)
+    scaled = values * 10.0 ** digits
+    # removes binary noise (0.0075 is stored as 0.00749999...) from each value before rounding halves up
+    magnitude = np.floor(np.log10(np.abs(scaled), out=np.zeros_like(scaled), where=scaled != 0))
+    factor = 10.0 ** (14 - magnitude)
+    scaled = np.round(scaled * factor) / factor
+    return np.sign(scaled) * np.floor(np.abs(scaled) + 0.5) / 10.0 ** digits
+
+
+def summarize_chunks(chunks, grid_y):
+    """Goes once through the point chunks of an export (arrays with SAR, X, Y, Z columns) and returns
+    a dict with what the evaluation needs: peak point, M2 value, step size and the lowest measurement points"""
+
+    stride = int(grid_y)
+    number_of_cells = 0
+    max_sar = None
+    peak = None
+    m2_row = None
+    m2_sar = 0.0        # M2 is the point after the peak, an empty cell (0) if the peak is the last point
+    m2_pending = False
+    first_point = None
+    x_values = []
+    y_values = []
+    lowest = []
+    for chunk in chunks:
+        sar = chunk[:, 0]
+        if m2_pending:
+            m2_sar = float(sar[0])
+            m2_pending = False
+        position = int(np.argmax(sar))     # MATCH(MAX(B:B),B:B,0) returns the first maximum
+        if max_sar is None or sar[position] > max_sar:
+            max_sar = float(sar[position])
+            peak = (float(chunk[position, 1]), float(chunk[position, 2]), float(chunk[position, 3]))
+            m2_row = number_of_cells + position + 4    # row of M2 in the worksheet, data starts from row 3
+            if position + 1 < len(chunk):
+                m2_sar = float(sar[position + 1])
+            else:
+                m2_sar = 0.0
+                m2_pending = True
+
+        # distinct X and Y coordinates after rounding (columns G and H in the workbook), used for step size
+        if first_point is None:
+            first_point = chunk[0]
+        x_values.append(np.unique(excel_round(chunk[:, 1] - first_point[1], 3) + first_point[1]))
+        y_values.append(np.unique(excel_round(chunk[:, 2] - first_point[2], 3) + first_point[2]))
+
+        # lowest measurement points are every gy:th point starting from the first one
+        offset = -number_of_cells % stride
+        lowest.append(chunk[offset::stride, :3])
+        number_of_cells += len(chunk)
+
+    lowest = np.concatenate(lowest) if lowest else np.empty((0, 3))
+    lowest = lowest[:int(number_of_cells / grid_y)]
+    step_x, uniform_x = grid_step(x_values)
+    step_y, uniform_y = grid_step(y_values)
+    return {
+        'number_of_cells': number_of_cells,
+        'max_sar': max_sar,
+        'peak': peak,
+        'm2_row': m2_row,
+        'm2_sar': m2_sar,
+        'step_x': step_x,
+        'step_y': step_y,
+        'uniform_grid': uniform_x and uniform_y,
+        'lowest_sar': lowest[:, 0],
+        'lowest_x': lowest[:, 1],
+        'lowest_y': lowest[:, 2],
+    }
+
+
+def snap_steps(steps):
+    """Array version of the rounding in round_step"""
+
+    return np.where((steps > 0.0065) & (steps < 0.009), 0.0075, np.round(steps, 4))
+
+
+def grid_step(coordinates):
+    """Returns the step size along one axis from lists of distinct rounded coordinates and True if
+    the grid is uniform, i.e. all steps round to the same value. Step is None if there is only one coordinate"""
+
+    coordinates = np.unique(np.concatenate(coordinates)) if coordinates else np.empty(0)
+    if coordinates.size < 2:
+        return None, True
+    steps = np.diff(coordinates)
+    snapped = snap_steps(steps)
+    return float(steps[0]), bool(np.all(snapped == snapped[0]))
+
+
+def round_step(step, allowed_step_sizes):
+    """Rounds a detected step size (J11) and checks it against allowed step sizes.
+    Returns the rounded step and True if the step size is not allowed"""
+
+    if step is None:
+        return 0.0, True
+    if step > 0.0065 and step < 0.009:
+        step_size_rounded = 0.0075
+    else:
+        step_size_rounded = float(round(step, 4))
+    return step_size_rounded, step_size_rounded not in allowed_step_sizes
+
+
+def evaluate_summary(summary, allowed_step_sizes):
+    """Evaluates one zoom scan summarized by summarize_chunks. Returns a dict with the same values the
+    Excel workbook would hold after recalculation and the verdict of the file ("Pass", "Fail", "Error")"""
+
+    max_sar = summary['max_sar']
+    peak_x, peak_y, _ = summary['peak']
+    ratio = summary['m2_sar'] / max_sar * 100
+    step, step_error = round_step(summary['step_x'], allowed_step_sizes)
+    step_y, step_y_error = round_step(summary['step_y'], allowed_step_sizes)
+    step_error = step_error or step_y_error
+
+    # checks around the peak are queries to grid indexes over the lowest measurement points
+    lowest_sar = summary['lowest_sar'] / max_sar
+    lowest = GridIndex(summary['lowest_x'], summary['lowest_y'], step)
+    next_to_peak = lowest.within(peak_x, peak_y, step + (step / 10))
+    below_3db = "Yes" if np.any(lowest_sar[next_to_peak] <= SAR_3DB_RATIO) else "No"
+
+    # workbook rounds distances to 0.1 mm and leaves out the ones rounded to 0
+    below_half = lowest_sar < MIN_DISTANCE_RATIO
+    below_half_points = GridIndex(summary['lowest_x'][below_half], summary['lowest_y'][below_half], step)
+    _, distance = below_half_points.nearest(peak_x, peak_y, accept=lambda distances: excel_round(distances, 4) != 0)
+    min_distance = float(excel_round(distance, 4)) * 1000 if distance is not None else float('nan')
+
+    remeasure = "No" if below_3db == "No" and ratio >= M2_M1_LIMIT else "Yes"
+    if step_error:
+        verdict = "Error"
+    elif remeasure == "No":
+        verdict = "Pass"
+    else:
+        verdict = "Fail"
+
+    return {
+        'number_of_cells': summary['number_of_cells'],
+        'max_sar': max_sar,
+        'm2_row': summary['m2_row'],
+        'peak': summary['peak'],
+        'step': step,
+        'step_y': step_y,
+        'uniform_grid': summary['uniform_grid'],
+        'step_error': step_error,
+        'ratio': ratio,
+        'below_3db': below_3db,
+        'remeasure': remeasure,
+        'min_distance': min_distance,
+        'verdict': verdict,
+    }
+
+
+def evaluate_scan(scan, allowed_step_sizes, surface_distance=None):
+    """Evaluates a zoom scan read with semcad_export.read_export or export_cache.load_export.
+    The points are gone through in chunks, so memory-mapped points are never loaded at once.
+    With surface_distance (see volume_average.peak_averages) the peak 1 g and 10 g averages are added"""
+
+    points = scan['points']
+    chunk_size = semcad_export.CHUNK_SIZE
+    chunks = (points[start:start + chunk_size] for start in range(0, len(points), chunk_size))
+    results = evaluate_summary(summarize_chunks(chunks, scan['grid_y']), allowed_step_sizes)
+    results.update((key, value) for key, value in scan.items() if not isinstance(value, np.ndarray))
+    if surface_distance is not None:
+        results.update(volume_average.peak_averages(points, surface_distance))
+    return results
+
+
+def evaluate_file(file_name, allowed_step_sizes, cache_dir=None, surface_distance=None):
+    """Reads and evaluates one SEMCAD export, used by SARzoom.py. Without cache_dir the export is read in
+    a single streaming pass, with it the parsed points come from (or are added to) export_cache"""
+
+    if cache_dir is not None:
+        scan = export_cache.load_export(file_name, cache_dir)
+        return evaluate_scan(scan, allowed_step_sizes, surface_distance)
+    with open(file_name) as export:
+        return evaluate_stream(export, allowed_step_sizes, surface_distance)
+
+
+def _keep(chunks, kept):
+    for chunk in chunks:
+        kept.append(chunk)
+        yield chunk
+
+
+def evaluate_stream(export, allowed_step_sizes, surface_distance=None):
+    """Evaluates a SEMCAD export from an open text file (or e.g. io.StringIO) positioned at its first line"""
+
+    header = semcad_export.read_header(export)
+    chunks = semcad_export.iter_chunks(export)
+    kept = []
+    if surface_distance is not None:
+        chunks = _keep(chunks, kept)
+    summary = summarize_chunks(chunks, header['grid_y'])
+    results = evaluate_summary(summary, allowed_step_sizes)
+    results.update(header)
+    if surface_distance is not None:
+        points = np.concatenate(kept) if kept else np.empty((0, len(semcad_export.COLUMNS)))
+        results.update(volume_average.peak_averages(points, surface_distance))
+    return results
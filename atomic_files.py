@@ -0,0 +1,111 @@
+import contextlib
+import hashlib
+import json
+import os
+import socket
+import tempfile
+import time
+
+"""
+Shared file helpers of the tools. Files that other runs, Excel or Word may read at the same time are written
+under a temporary name in the same folder and renamed over the old file, so a reader sees either the old or
+the new file but never a half-written one. Used for the reports, the liquid workbooks and the parsed export
+and frequency table caches. file_lock lets one run at a time read, change and replace a file that several
+runs add to, e.g. the liquid parameter report.
+"""
+
+BLOCK_SIZE = 1024 * 1024    # bytes read at a time when hashing a file
+LOCK_POLL_INTERVAL = 0.2    # seconds between attempts to take a file lock
+
+
+def file_hash(file_name):
+    """Returns the SHA-256 hex digest of a file's contents"""
+
+    digest = hashlib.sha256()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def file_mode(file_name):
+    """Permission bits for a new version of file_name: those of the file, or the default of a new file
+    (0o666 without the umask) if it does not exist yet"""
+
+    try:
+        return os.stat(file_name).st_mode & 0o777
+    except FileNotFoundError:
+        umask = os.umask(0)     # the umask can only be read by setting it
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def replace_atomic(file_name, write, unchanged=None):
+    """Calls write(path) with a temporary file next to file_name, e.g. the save method of an openpyxl workbook
+    or python-docx document, and renames it over file_name with the permissions of file_mode, so a file on a
+    shared folder stays readable by the other users. unchanged is an optional check made just before the
+    rename, if it returns False the file is left as it is. Returns True if file_name was replaced"""
+
+    folder, name = os.path.split(os.path.abspath(file_name))
+    handle, part = tempfile.mkstemp(prefix=f".{name}.", suffix=".part", dir=folder)
+    os.close(handle)
+    try:
+        write(part)
+        os.chmod(part, file_mode(file_name))    # mkstemp creates the file readable by its owner only
+        if unchanged is not None and not unchanged():
+            os.remove(part)
+            return False
+        os.replace(part, file_name)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    return True
+
+
+def lock_name(file_name):
+    """Name of the lock file of file_name, e.g. Report.docx -> .Report.docx.lock in the same folder"""
+
+    folder, name = os.path.split(os.path.abspath(file_name))
+    return os.path.join(folder, f".{name}.lock")
+
+
+@contextlib.contextmanager
+def file_lock(file_name, timeout):
+    """Holds the lock of file_name while the with block runs. The lock is a file created with O_CREAT | O_EXCL,
+    which only one run can do at a time, also on a shared network folder, and it is removed when the block ends.
+    Waits up to timeout seconds for another run to release it, then raises TimeoutError. A lock left by a run
+    that was killed is not removed automatically, the error tells which run took it"""
+
+    lock = lock_name(file_name)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            handle = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() >= deadline:
+                try:
+                    with open(lock) as f:
+                        owner = f.read().strip() or "unknown"
+                except OSError:
+                    owner = "unknown"
+                raise TimeoutError(f"{file_name} is locked by another run ({owner}). If that run is no longer "
+                                   f"running, remove {lock}")
+            time.sleep(LOCK_POLL_INTERVAL)
+    try:
+        with os.fdopen(handle, "w") as f:
+            f.write(f"host {socket.gethostname()}, process {os.getpid()}, {time.ctime()}\n")
+        yield
+    finally:
+        os.remove(lock)
+
+
+def write_json(value, file_name):
+    """Writes value as JSON to file_name with replace_atomic"""
+
+    def write(part):
+        with open(part, "w") as f:
+            json.dump(value, f)
+
+    replace_atomic(file_name, write)
@@ -0,0 +1,133 @@
+import json
+import os
+import numpy as np
+import openpyxl as xl
+import pandas as pd
+
+"""
+Generators for synthetic input data of the three tools. The data has the layout of the real files but random
+values: SEMCAD zoom scan exports for SARzoom.py, Liquid workbooks with a "frequency table.xlsx" for liquids.py
+and lteresults_cal.txt logs for conductedmax.py. The same seed always gives the same files.
+"""
+
+SAR_STEP_SIZES = [0.0075, 0.004, 0.005]     # zoomscan.ALLOWED_STEP_SIZES
+LTE_BANDS = [1, 2, 3, 4, 5, 7, 8, 12, 13, 17, 20, 25, 26, 28, 38, 40, 41, 66]
+LTE_CHANNEL_TYPES = ["LOW CH", "Low CH", "MID CH", "Mid CH", "HIGH CH", "High CH"]
+LIQUID_BANDS = {
+    'B5': [826.5, 836.5, 846.5],
+    'B8': [882.5, 897.5, 912.5],
+    'B3': [1712.5, 1747.5, 1782.5],
+    'B1': [1922.4, 1950.0, 1977.6],
+    'B7': [2510.0, 2535.0, 2560.0],
+    'B41': [2506.0, 2593.0, 2680.0],
+}
+
+
+def semcad_export(file_name, program_name, grid=7, layers=7, step=0.005, seed=0):
+    """Writes a SEMCAD zoom scan export of grid x grid points on layers layers, SAR peaks near the middle
+    of the lowest layer and decays upwards"""
+
+    rng = np.random.default_rng(seed)
+    x = 0.01 + np.arange(grid) * step
+    y = -0.02 + np.arange(grid) * step
+    z = 0.002 + np.arange(layers) * 0.005
+    # z changes fastest, so every layers-th point is on the lowest layer
+    xx, yy, zz = (values.ravel() for values in np.meshgrid(x, y, z, indexing='ij'))
+    peak_x = x[grid // 2] + rng.uniform(-step, step)
+    peak_y = y[grid // 2] + rng.uniform(-step, step)
+    width = max(step * grid / 4, 0.004)
+    sar = (rng.uniform(0.5, 5) * np.exp(-((xx - peak_x) ** 2 + (yy - peak_y) ** 2) / (2 * width ** 2))
+           * np.exp(-(zz - z[0]) / 0.01) + rng.random(len(xx)) * 1e-3)
+    with open(file_name, "w") as export:
+        export.write("SEMCAD X field export\n")
+        export.write("Quantity: SAR\n")
+        export.write(f"Source: /Simulations/Program/{program_name}/Sim 1/Overall Field\n")
+        export.write(f"Grid: {grid}x{grid}x{layers}\n")
+        export.write("Value\t\tX\t\tY\t\tZ\n")
+        export.write("[W/kg]\t\t[m]\t\t[m]\t\t[m]\n")
+        np.savetxt(export, np.column_stack((sar, xx, yy, zz)), fmt=["%.6e", "%.6f", "%.6f", "%.6f"],
+                   delimiter="\t\t")
+
+
+def sar_dataset(directory, files=5, grid=7, layers=7, seed=0):
+    """Writes files exports to directory with step sizes taken in turn from SAR_STEP_SIZES.
+    Returns the list of file names"""
+
+    file_names = []
+    for number in range(files):
+        file_name = os.path.join(directory, f"export_{number:04d}.txt")
+        semcad_export(file_name, f"Scan{number:04d}", grid, layers,
+                      SAR_STEP_SIZES[number % len(SAR_STEP_SIZES)], seed + number)
+        file_names.append(file_name)
+    return file_names
+
+
+def liquid_workbook(file_name, rows=541, start=600, step=10, seed=0):
+    """Writes a liquid measurement workbook with rows measured frequencies from start MHz in steps of step MHz,
+    in the columns read by liquid_params.py (A frequency, B/D measured, J/L targets, S/U deltas)"""
+
+    rng = np.random.default_rng(seed)
+    frequency = start + np.arange(rows) * step
+    e = 40 + rng.random(rows)
+    sigma = 0.9 + frequency / 5000 + rng.random(rows) * 0.01
+    e_target = 41.5 - frequency / 2000
+    sigma_target = 0.9 + frequency / 4800
+    e_delta = rng.uniform(-2, 2, rows)
+    sigma_delta = rng.uniform(-2, 2, rows)
+    wb = xl.Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    ws.append(["Liquid measurement"])
+    ws.append(["Freq [MHz]", "e'", None, "sigma [S/m]"] + [None] * 5 + ["e' target", None, "sigma target"]
+              + [None] * 6 + ["e' delta %", None, "sigma delta %"])
+    for row in zip(frequency.tolist(), e.tolist(), sigma.tolist(), e_target.tolist(), sigma_target.tolist(),
+                   e_delta.tolist(), sigma_delta.tolist()):
+        f, e_value, sigma_value, e_target_value, sigma_target_value, e_delta_value, sigma_delta_value = row
+        ws.append([f, e_value, None, sigma_value] + [None] * 5 + [e_target_value, None, sigma_target_value]
+                  + [None] * 6 + [e_delta_value, None, sigma_delta_value])
+    wb.save(file_name)
+
+
+def frequency_table(file_name, bands=LIQUID_BANDS):
+    """Writes "frequency table.xlsx" with one column of frequencies per band"""
+
+    length = max(len(frequencies) for frequencies in bands.values())
+    columns = {band: frequencies + [None] * (length - len(frequencies)) for band, frequencies in bands.items()}
+    pd.DataFrame(columns).to_excel(file_name, sheet_name='Sheet1', index=False)
+
+
+def liquid_dataset(directory, files=3, rows=541, seed=0):
+    """Writes files liquid workbooks, the frequency table and a manifest.json for the batch mode of liquids.py,
+    each workbook gets three bands of LIQUID_BANDS in turn. Returns the manifest file name"""
+
+    frequency_table(os.path.join(directory, "frequency table.xlsx"))
+    band_names = list(LIQUID_BANDS)
+    manifest = {}
+    for number in range(files):
+        excel_name = f"liquid_{number:04d}.xlsx"
+        liquid_workbook(os.path.join(directory, excel_name), rows, seed=seed + number)
+        manifest[excel_name] = [band_names[(number + offset) % len(band_names)] for offset in range(3)]
+    manifest_name = os.path.join(directory, "manifest.json")
+    with open(manifest_name, "w") as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest_name
+
+
+def lte_results(file_name, rows=10000, seed=0, chunk_rows=500000):
+    """Writes a tab separated lteresults_cal.txt log with rows measurements, in chunks of chunk_rows"""
+
+    rng = np.random.default_rng(seed)
+    with open(file_name, "w") as log:
+        log.write("Band\tBandwidth\tRB Size\tRB Offset\tModulation\tChannel Type\tChannel\tFrequency\tPower\n")
+        for first in range(0, rows, chunk_rows):
+            count = min(chunk_rows, rows - first)
+            pd.DataFrame({
+                'Band': rng.choice(LTE_BANDS, count),
+                'BW': rng.choice([1.4, 3, 5, 10, 15, 20], count),
+                'RBs': rng.choice([1, 25, 50, 100], count),
+                'RB Start': rng.choice([0, 12, 24, 49], count),
+                'Modulation': rng.choice(["QPSK", "16QAM", "64QAM"], count),
+                'ChanType': rng.choice(LTE_CHANNEL_TYPES, count),
+                'Channel': rng.integers(0, 70000, count),
+                'Frequency': np.round(rng.uniform(600, 2700, count), 1),
+                'Power': np.round(rng.normal(22.5, 0.5, count), 2),
+            }).to_csv(log, sep="\t", header=False, index=False)
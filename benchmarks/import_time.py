@@ -0,0 +1,73 @@
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+"""
+Import-time budget check of the command line entry point and the tool modules. Each module is imported in a
+new interpreter with -X importtime, its cumulative import time is compared with its budget and the script exits
+with status 1 if any module is over budget. pandas, openpyxl and python-docx must not be imported by these,
+they are loaded by the steps that use them:
+
+    python benchmarks/import_time.py [--factor 2]
+
+run_benchmarks.py runs the same check and fails when a module is over budget.
+"""
+
+BUDGETS = {     # module: budget in seconds
+    'verkotan': 0.05,
+    'ConductedMax.conductedmax': 0.05,
+    'Liquids.liquids': 0.5,         # numpy
+    'SAR_ZoomScan.SARzoom': 0.5,    # numpy
+}
+HEAVY_MODULES = ["pandas", "openpyxl", "docx", "xlwings"]
+
+
+def import_time(module):
+    """Returns (cumulative import time of module in seconds, names of all imported top-level modules)"""
+
+    code = f"import sys; sys.path.insert(0, {ROOT!r}); import {module}"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True,
+                            text=True, check=True)
+    cumulative = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:"):].split("|")
+        if not cumulative_us.strip().isdigit():     # header line
+            continue
+        imported.add(name.strip().split(".")[0])
+        if name.strip() == module:
+            cumulative = int(cumulative_us) / 1e6
+    return cumulative, imported
+
+
+def check_budgets(factor=1.0):
+    """Imports each module of BUDGETS, prints its import time against its budget times factor and returns
+    {module: {'import_s', 'budget_s', 'heavy', 'ok'}}"""
+
+    results = {}
+    for module, budget in BUDGETS.items():
+        seconds, imported = import_time(module)
+        heavy = sorted(imported.intersection(HEAVY_MODULES))
+        ok = seconds is not None and seconds <= budget * factor and not heavy
+        results[module] = {'import_s': seconds, 'budget_s': budget * factor, 'heavy': heavy, 'ok': ok}
+        print(f"{'ok' if ok else 'FAIL':<5}{module:<27}{seconds or 0:8.3f} s (budget {budget * factor:.3f} s)"
+              + (f", imports {', '.join(heavy)}" if heavy else ""))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Checks the import time of the SAR lab tools against budgets")
+    parser.add_argument("--factor", type=float, default=1.0, help="multiplies all budgets, e.g. for slow PCs")
+    args = parser.parse_args()
+
+    results = check_budgets(args.factor)
+    sys.exit(0 if all(result['ok'] for result in results.values()) else 1)
+
+
+if __name__ == "__main__":
+    main()
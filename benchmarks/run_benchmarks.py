@@ -0,0 +1,263 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+try:
+    import resource
+except ImportError:     # not available on Windows, peak memory of whole runs is left out
+    resource = None
+import generate
+import import_time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)     # the tool packages and report_table.py are in the repository root
+import report_table
+from Liquids import frequency_table, liquid_params
+from SAR_ZoomScan import audit_workbook, semcad_export, volume_average, zoomscan
+import openpyxl as xl
+from docx import Document
+
+"""
+Benchmarks of SARzoom.py, liquids.py and conductedmax.py on synthetic data (see generate.py).
+Stages are timed in this process by calling the modules of the tools, whole runs are timed as separate
+processes in a temporary folder. Results are written as JSON and can be compared with an earlier run:
+
+    python benchmarks/run_benchmarks.py --scale medium --output new.json --compare old.json
+
+Each benchmark reports the median and minimum wall time of --repeat runs, items per second and peak memory:
+Python allocations of one extra run for stages (tracemalloc), peak RSS of the process for whole runs.
+"""
+
+SCALES = {
+    'small': {'sar_files': 6, 'sar_grid': 7, 'sar_layers': 7, 'liquid_files': 3, 'liquid_rows': 541, 'lte_rows': 10000},
+    'medium': {'sar_files': 30, 'sar_grid': 15, 'sar_layers': 10, 'liquid_files': 20, 'liquid_rows': 541, 'lte_rows': 1000000},
+    'large': {'sar_files': 100, 'sar_grid': 25, 'sar_layers': 15, 'liquid_files': 100, 'liquid_rows': 2000, 'lte_rows': 10000000},
+}
+
+
+def measure(function, repeat, items):
+    """Times function() repeat times and once more with tracemalloc for its peak Python allocations"""
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        function()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return summarize(times, items, peak_bytes=peak)
+
+
+def summarize(times, items, **extra):
+    median = statistics.median(times)
+    return {'wall_s': median, 'wall_min_s': min(times), 'items': items,
+            'items_per_s': items / median if median > 0 else None, **extra}
+
+
+def run_process(args, cwd, stdin_text="", env=None):
+    """Runs a script to the end, returns (wall time, peak RSS in bytes or None, exit code, stderr)"""
+
+    with tempfile.TemporaryFile(mode="w+") as errors:
+        start = time.perf_counter()
+        process = subprocess.Popen(args, cwd=cwd, env=env, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                   stderr=errors, text=True)
+        process.communicate(stdin_text)
+        wall = time.perf_counter() - start
+        errors.seek(0)
+        message = errors.read()
+    peak = None
+    if resource is not None:
+        scale = 1 if sys.platform == "darwin" else 1024     # ru_maxrss is in bytes on macOS, kilobytes elsewhere
+        peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return wall, peak, process.returncode, message
+
+
+def measure_process(make_folder, args, repeat, items, stdin_text="", env=None):
+    """Times a whole run of a script repeat times, each run in a new folder filled by make_folder(folder)"""
+
+    times = []
+    peak = None
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as folder:
+            extra_args = make_folder(folder) or []
+            wall, peak, code, message = run_process(args + extra_args, folder, stdin_text, env)
+            if code != 0:
+                return {'error': f"exit code {code}: {message.strip()[-500:]}"}
+            times.append(wall)
+    # RUSAGE_CHILDREN is the largest child so far, so it is an upper bound when several scripts are run
+    return summarize(times, items, peak_rss_children_bytes=peak)
+
+
+def sar_benchmarks(folder, scale, repeat, seed):
+    file_names = generate.sar_dataset(folder, scale['sar_files'], scale['sar_grid'], scale['sar_layers'], seed)
+    allowed = generate.SAR_STEP_SIZES
+    points = scale['sar_files'] * scale['sar_grid'] ** 2 * scale['sar_layers']
+    results = {}
+    results['sar_parse'] = measure(lambda: [semcad_export.read_export(f) for f in file_names], repeat, points)
+    results['sar_evaluate'] = measure(lambda: [zoomscan.evaluate_file(f, allowed) for f in file_names], repeat, points)
+    scans = [semcad_export.read_export(f) for f in file_names]
+    results['sar_volume_average'] = measure(
+        lambda: [volume_average.peak_averages(scan['points']) for scan in scans], repeat, points)
+    cache_dir = os.path.join(folder, "cache")
+    for f in file_names:    # fills the cache, timed runs read from it
+        zoomscan.evaluate_file(f, allowed, cache_dir)
+    results['sar_evaluate_cached'] = measure(
+        lambda: [zoomscan.evaluate_file(f, allowed, cache_dir) for f in file_names], repeat, points)
+    sheets = [(os.path.basename(f), f, zoomscan.evaluate_file(f, allowed, cache_dir)) for f in file_names]
+    results['sar_workbook'] = measure(
+        lambda: audit_workbook.write_workbook(os.path.join(folder, "results.xlsx"), sheets, cache_dir), repeat, points)
+
+    def sar_folder(run_folder):
+        generate.sar_dataset(run_folder, scale['sar_files'], scale['sar_grid'], scale['sar_layers'], seed)
+    # the export cache of the run goes to the temporary home folder
+    env = dict(os.environ, HOME=folder, USERPROFILE=folder)
+    results['sar_end_to_end'] = measure_process(
+        sar_folder, [sys.executable, os.path.join(ROOT, "SAR_ZoomScan", "SARzoom.py")], repeat, scale['sar_files'],
+        stdin_text="\n", env=env)
+    return results
+
+
+def liquid_benchmarks(folder, scale, repeat, seed):
+    manifest_name = generate.liquid_dataset(folder, scale['liquid_files'], scale['liquid_rows'], seed)
+    with open(manifest_name) as manifest_file:
+        manifest = json.load(manifest_file)
+    file_names = [os.path.join(folder, excel_name) for excel_name in manifest]
+    frequencies = [sum((generate.LIQUID_BANDS[band] for band in bands), []) for bands in manifest.values()]
+    rows = sum(len(f) for f in frequencies)
+    results = {}
+
+    table_name = os.path.join(folder, "frequency table.xlsx")
+    table_cache = os.path.join(folder, "table_cache")
+    results['liquid_frequency_table'] = measure(lambda: frequency_table.read_table(table_name), repeat, 1)
+
+    def cached_table():
+        frequency_table._tables.clear()     # reads the cache entry on disk, not the copy in memory
+        return frequency_table.load_table(table_name, table_cache)
+    cached_table()
+    results['liquid_frequency_table_cached'] = measure(cached_table, repeat, 1)
+
+    def read_liquids():
+        liquids = []
+        for file_name in file_names:
+            wb = xl.load_workbook(file_name, read_only=True)
+            liquids.append(liquid_params.read_liquid(wb.active))
+            wb.close()
+        return liquids
+    results['liquid_read'] = measure(read_liquids, repeat, len(file_names))
+    liquids = read_liquids()
+    results['liquid_interpolate'] = measure(
+        lambda: [liquid_params.interpolate(liquid, f) for liquid, f in zip(liquids, frequencies)], repeat, rows)
+
+    def write_table():
+        document = Document()
+        table = document.add_table(rows=2, cols=10)
+        style = report_table.paragraph_style(document, "Liquid Table Text", 7)
+        for liquid, f in zip(liquids, frequencies):
+            values = liquid_params.interpolate(liquid, f).tolist()
+            report_table.add_rows(table, [["01.01.2020", "WB Head", "22"] + row for row in values], style)
+        document.save(os.path.join(folder, "Report.docx"))
+    results['liquid_report'] = measure(write_table, repeat, rows)
+
+    def liquid_folder(run_folder):
+        return [generate.liquid_dataset(run_folder, scale['liquid_files'], scale['liquid_rows'], seed)]
+    # the frequency table cache of the run goes to the temporary home folder
+    env = dict(os.environ, HOME=folder, USERPROFILE=folder)
+    results['liquid_end_to_end'] = measure_process(
+        liquid_folder, [sys.executable, os.path.join(ROOT, "Liquids", "liquids.py")], repeat, len(file_names),
+        env=env)
+    return results
+
+
+def lte_benchmarks(folder, scale, repeat, seed):
+    def lte_folder(run_folder):
+        generate.lte_results(os.path.join(run_folder, "lteresults_cal.txt"), scale['lte_rows'], seed)
+    return {'lte_end_to_end': measure_process(
+        lte_folder, [sys.executable, os.path.join(ROOT, "ConductedMax", "conductedmax.py")], repeat, scale['lte_rows'])}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, old_file_name):
+    """Prints the median times of results next to the ones in an earlier results file"""
+
+    with open(old_file_name) as old_file:
+        old = json.load(old_file)
+    print(f"\n{'benchmark':<24}{'old (s)':>12}{'new (s)':>12}{'new/old':>10}")
+    for name, result in results['benchmarks'].items():
+        old_result = old.get('benchmarks', {}).get(name, {})
+        if 'wall_s' not in result or 'wall_s' not in old_result:
+            print(f"{name:<24}{'-':>12}{'-':>12}{'-':>10}")
+            continue
+        ratio = result['wall_s'] / old_result['wall_s'] if old_result['wall_s'] else float('nan')
+        print(f"{name:<24}{old_result['wall_s']:>12.4f}{result['wall_s']:>12.4f}{ratio:>10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks of the SAR lab tools on synthetic data")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs of each benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", choices=["sar", "liquid", "lte"], action="append",
+                        help="run only these tools, can be given several times")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="earlier results file to compare with")
+    parser.add_argument("--import-factor", type=float, default=1.0,
+                        help="multiplies the import time budgets of import_time.py, e.g. for slow PCs")
+    args = parser.parse_args()
+
+    scale = SCALES[args.scale]
+    suites = {'sar': sar_benchmarks, 'liquid': liquid_benchmarks, 'lte': lte_benchmarks}
+    results = {
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'parameters': scale,
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'benchmarks': {},
+    }
+    print("Checking import times")
+    results['import_time'] = import_time.check_budgets(args.import_factor)
+    for name, suite in suites.items():
+        if args.only and name not in args.only:
+            continue
+        print(f"Running {name} benchmarks")
+        with tempfile.TemporaryDirectory() as folder:
+            results['benchmarks'].update(suite(folder, scale, args.repeat, args.seed))
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    for name, result in results['benchmarks'].items():
+        if 'error' in result:
+            print(f"{name}: {result['error']}")
+        else:
+            print(f"{name}: {result['wall_s']:.4f} s, {result['items_per_s']:.0f} items/s")
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    over_budget = [module for module, result in results['import_time'].items() if not result['ok']]
+    if over_budget:
+        print(f"Import time over budget: {', '.join(over_budget)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
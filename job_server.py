@@ -0,0 +1,265 @@
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+import verkotan
+
+"""
+Analysis server for the whole lab: accepts SEMCAD exports, liquid workbooks and LTE logs over HTTP, queues
+them per job type and runs the computations of the tools in a pool of worker processes. Started with
+python verkotan.py serve [--port 8080], only the Python standard library is needed on top of the tools.
+
+    POST /jobs/sar?name=scan.txt                 body: SEMCAD export text
+    POST /jobs/liquid?bands=B1,B5                body: liquid workbook (.xlsx), frequencies= can be given instead
+    POST /jobs/lte                               body: lteresults_cal.txt log
+        -> 202 {"id": ...}, 503 when the queue of the job type or the memory for uploads is full,
+           413 when the body is too large, 408 when the client stops sending
+        -> 411 without a Content-Length header, chunked uploads are not accepted
+    GET /jobs/<id>?wait=30                       status and result, waits up to wait seconds for the job to finish
+    GET /jobs/<id>/report?wait=30                result as a Word document: the Report.docx table of SARzoom.py or
+                                                 liquids.py, or conducted maximums.docx, 409 until the job is done
+    GET /status                                  queued and running jobs per type
+
+Results are the JSON of the library functions in verkotan.py (verdicts, maximum power tables, liquid parameters),
+the reports are written by its sar_report, conducted_report and liquid_report in a worker process.
+"""
+
+CONCURRENCY = {'sar': 4, 'liquid': 2, 'lte': 1}     # jobs of each type run at the same time
+QUEUE_SIZE = {'sar': 200, 'liquid': 50, 'lte': 10}  # waiting jobs of each type before new ones are refused
+MAX_BODY_SIZE = 512 * 1024**2   # bytes, largest accepted upload
+MAX_QUEUED_BYTES = 2 * 1024**3  # bytes of uploads being read, queued or running at once, new ones are refused above this
+READ_TIMEOUT = 30   # seconds a client may send nothing before its connection is closed
+READ_BLOCK_SIZE = 1024**2   # bytes of a body read at a time
+KEPT_JOBS = 1000    # finished jobs whose results can still be fetched
+REPORT_NAMES = {'sar': "Report.docx", 'liquid': "Report.docx", 'lte': "conducted maximums.docx"}
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def run_job(job_type, data, options):
+    """Runs one job in a worker process and returns its JSON-compatible result"""
+
+    if job_type == 'sar':
+        return verkotan.evaluate_sar(io.StringIO(data.decode("utf-8", errors="replace")))
+    if job_type == 'lte':
+        return verkotan.conducted_maximums([io.StringIO(data.decode("utf-8", errors="replace"))])
+    frequencies = [float(frequency) for frequency in options.get('frequencies', []) if frequency]
+    if options.get('bands'):
+        frequencies += verkotan.band_frequencies(options['frequency_table'], options['bands'])
+    return verkotan.liquid_parameters(io.BytesIO(data), frequencies)
+
+
+def run_report(job_type, result):
+    """Writes the Word report of a finished job in a worker process and returns the .docx bytes"""
+
+    output = io.BytesIO()
+    if job_type == 'sar':
+        verkotan.sar_report([result], output)
+    elif job_type == 'lte':
+        verkotan.conducted_report(result, output)
+    else:
+        verkotan.liquid_report(result, output)
+    return output.getvalue()
+
+
+class JobServer:
+    """Queues, worker tasks and job records of the server"""
+
+    def __init__(self, workers=None, frequency_table="frequency table.xlsx"):
+        # spawned, not forked: a forked worker would keep the client sockets of the server open
+        self.executor = ProcessPoolExecutor(max_workers=workers or sum(CONCURRENCY.values()),
+                                            mp_context=multiprocessing.get_context("spawn"))
+        self.frequency_table = os.path.abspath(frequency_table)
+        self.queues = {job_type: asyncio.Queue(maxsize=QUEUE_SIZE[job_type]) for job_type in CONCURRENCY}
+        self.running = {job_type: 0 for job_type in CONCURRENCY}
+        self.queued_bytes = 0   # uploads held in memory, reserved before a body is read
+        self.jobs = {}  # {id, job record}
+        self.finished = deque()     # ids of finished jobs, oldest first
+        self.tasks = []
+
+    def start(self):
+        for job_type, count in CONCURRENCY.items():
+            for _ in range(count):
+                self.tasks.append(asyncio.create_task(self.worker(job_type)))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(cancel_futures=True)
+
+    def submit(self, job_type, name, data, options):
+        """Queues a job and returns its record, raises asyncio.QueueFull when the queue is full"""
+
+        job = {'id': uuid.uuid4().hex, 'type': job_type, 'name': name, 'status': "queued",
+               'submitted': time.time(), 'done': asyncio.Event()}
+        self.queues[job_type].put_nowait((job, data, options))
+        self.jobs[job['id']] = job
+        return job
+
+    async def worker(self, job_type):
+        loop = asyncio.get_running_loop()
+        queue = self.queues[job_type]
+        while True:
+            job, data, options = await queue.get()
+            job['status'] = "running"
+            self.running[job_type] += 1
+            try:
+                job['result'] = await loop.run_in_executor(self.executor, run_job, job_type, data, options)
+                job['status'] = "done"
+            except Exception as error:
+                job['status'] = "failed"
+                job['error'] = f"{type(error).__name__}: {error}"
+            finally:
+                self.running[job_type] -= 1
+                self.queued_bytes -= len(data)
+                job['finished'] = time.time()
+                job['done'].set()
+                queue.task_done()
+                self.finished.append(job['id'])
+                if len(self.finished) > KEPT_JOBS:
+                    del self.jobs[self.finished.popleft()]
+
+    def status(self):
+        return {job_type: {'queued': self.queues[job_type].qsize(), 'running': self.running[job_type],
+                           'concurrency': CONCURRENCY[job_type]} for job_type in CONCURRENCY}
+
+    async def handle(self, reader, writer):
+        """Handles one HTTP request per connection. Bodies are JSON, except reports which respond returns as
+        (file name, bytes)"""
+
+        try:
+            status, body = await self.respond(reader)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            status, body = HTTPStatus.BAD_REQUEST, {'error': "malformed request"}
+        except asyncio.TimeoutError:
+            status, body = HTTPStatus.REQUEST_TIMEOUT, {'error': f"nothing received in {READ_TIMEOUT} s"}
+        if isinstance(body, tuple):
+            file_name, payload = body
+            headers = f"Content-Type: {DOCX_TYPE}\r\nContent-Disposition: attachment; filename=\"{file_name}\"\r\n"
+        else:
+            payload = json.dumps(body).encode()
+            headers = "Content-Type: application/json\r\n"
+        writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n{headers}"
+                     f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode() + payload)
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def read_body(self, reader, length):
+        """Reads a body of length bytes in blocks, raises asyncio.TimeoutError if a block does not arrive
+        in READ_TIMEOUT seconds"""
+
+        data = bytearray(length)
+        view = memoryview(data)
+        received = 0
+        while received < length:
+            block = await asyncio.wait_for(reader.read(min(READ_BLOCK_SIZE, length - received)), READ_TIMEOUT)
+            if not block:
+                raise asyncio.IncompleteReadError(b"", length - received)
+            view[received:received + len(block)] = block
+            received += len(block)
+        return data
+
+    async def respond(self, reader):
+        request_line = (await asyncio.wait_for(reader.readline(), READ_TIMEOUT)).decode("latin-1").split()
+        if len(request_line) != 3:
+            raise ValueError("bad request line")
+        method, target, _ = request_line
+        headers = {}
+        while True:
+            line = (await asyncio.wait_for(reader.readline(), READ_TIMEOUT)).decode("latin-1")
+            if line in ("\r\n", "\n", ""):
+                break
+            key, _, value = line.partition(":")
+            headers[key.strip().lower()] = value.strip()
+        url = urlsplit(target)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        parts = [part for part in url.path.split("/") if part]
+
+        if method == "POST" and len(parts) == 2 and parts[0] == "jobs":
+            job_type = parts[1]
+            if job_type not in CONCURRENCY:
+                return HTTPStatus.NOT_FOUND, {'error': f"unknown job type {job_type}"}
+            if "content-length" not in headers:
+                return HTTPStatus.LENGTH_REQUIRED, {'error': "Content-Length header is required"}
+            length = int(headers["content-length"])
+            if length < 0:
+                raise ValueError("negative Content-Length")
+            if length > MAX_BODY_SIZE:
+                return HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': f"body larger than {MAX_BODY_SIZE} bytes"}
+            if self.queues[job_type].full():     # refused before the upload is read
+                return HTTPStatus.SERVICE_UNAVAILABLE, {'error': f"{job_type} queue is full, try again later"}
+            if self.queued_bytes + length > MAX_QUEUED_BYTES:
+                return HTTPStatus.SERVICE_UNAVAILABLE, {'error': "too many uploads waiting, try again later"}
+            self.queued_bytes += length     # reserved while the body is read, released when the job has run
+            try:
+                data = await self.read_body(reader, length)
+                options = {
+                    'frequencies': query.get('frequencies', "").split(","),
+                    'bands': [band.strip() for band in query.get('bands', "").split(",") if band.strip()],
+                    'frequency_table': self.frequency_table,
+                }
+                job = self.submit(job_type, query.get('name', ""), data, options)
+            except asyncio.QueueFull:
+                self.queued_bytes -= length
+                return HTTPStatus.SERVICE_UNAVAILABLE, {'error': f"{job_type} queue is full, try again later"}
+            except BaseException:
+                self.queued_bytes -= length
+                raise
+            return HTTPStatus.ACCEPTED, {'id': job['id'], 'status': job['status']}
+
+        if method == "GET" and len(parts) in (2, 3) and parts[0] == "jobs" and parts[2:] in ([], ["report"]):
+            job = self.jobs.get(parts[1])
+            if job is None:
+                return HTTPStatus.NOT_FOUND, {'error': "unknown job"}
+            wait = float(query.get('wait', 0))
+            if wait > 0 and not job['done'].is_set():
+                try:
+                    await asyncio.wait_for(job['done'].wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+            if len(parts) == 2:
+                return HTTPStatus.OK, {key: value for key, value in job.items() if key != 'done'}
+            if job['status'] != "done":
+                return HTTPStatus.CONFLICT, {'error': f"job is {job['status']}, a report needs a finished job"}
+            loop = asyncio.get_running_loop()
+            try:
+                report = await loop.run_in_executor(self.executor, run_report, job['type'], job['result'])
+            except Exception as error:
+                return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f"{type(error).__name__}: {error}"}
+            return HTTPStatus.OK, (REPORT_NAMES[job['type']], report)
+
+        if method == "GET" and parts == ["status"]:
+            return HTTPStatus.OK, self.status()
+        return HTTPStatus.NOT_FOUND, {'error': "not found"}
+
+
+async def serve(host="127.0.0.1", port=8080, workers=None, frequency_table="frequency table.xlsx"):
+    job_server = JobServer(workers, frequency_table)
+    job_server.start()
+    server = await asyncio.start_server(job_server.handle, host, port)
+    print(f"Serving on http://{host}:{port}, press Ctrl+C to stop")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await job_server.stop()
+
+
+def main(host="127.0.0.1", port=8080, workers=None, frequency_table="frequency table.xlsx"):
+    try:
+        asyncio.run(serve(host, port, workers, frequency_table))
+    except KeyboardInterrupt:
+        print("Server stopped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+from docx.enum.style import WD_STYLE_TYPE
+from docx.shared import Pt
+
+"""
+Shared helpers for the Word tables written by SARzoom.py, liquids.py and conductedmax.py.
+Rows are appended straight to the table XML, and fonts come from paragraph styles that are added to the
+document once, so writing a table takes the same time per row no matter how long the table already is.
+Accessing table.rows[i] or setting fonts run by run would go through the whole table each time.
+"""
+
+
+def paragraph_style(document, name, size, bold=False):
+    """Returns the name of a paragraph style with the given font, adding the style to the document
+    the first time. Based on Normal, so only the font differs from text without a style"""
+
+    styles = document.styles
+    try:
+        styles[name]
+    except KeyError:
+        style = styles.add_style(name, WD_STYLE_TYPE.PARAGRAPH)
+        style.base_style = styles['Normal']
+        style.font.size = Pt(size)
+        style.font.bold = bold
+    return name
+
+
+def style_cells(cells, style_name):
+    """Sets the paragraph style of every paragraph in cells, e.g. the header cells of a table"""
+
+    for cell in cells:
+        for paragraph in cell.paragraphs:
+            paragraph.style = style_name
+
+
+def add_rows(table, rows, style_name=None):
+    """Appends rows to the end of table. rows is an iterable of lists with one value per column,
+    values are written as text with the given paragraph style"""
+
+    tbl = table._tbl
+    widths = [grid_col.w for grid_col in tbl.tblGrid.gridCol_lst]
+    style_id = table.part.get_style_id(style_name, WD_STYLE_TYPE.PARAGRAPH) if style_name else None
+    for values in rows:
+        tr = tbl.add_tr()
+        for width, value in zip(widths, values):
+            tc = tr.add_tc()
+            tc.width = width
+            p = tc.p_lst[0]
+            if style_id is not None:
+                p.style = style_id
+            p.add_r().text = str(value)
@@ -0,0 +1,256 @@
+import argparse
+import importlib
+import json
+import math
+import os
+import sys
+
+"""
+Command line entry point and library API of the SAR lab tools. Each tool is imported only when it is used,
+and the tools import pandas, openpyxl and python-docx only in the steps that need them, so short runs and
+--help do not pay for loading every library.
+
+Commands that run a whole tool in the current folder and write its reports:
+    python verkotan.py sar [--watch [INBOX]] [--no-excel]    zoom scan analysis of the .txt exports
+    python verkotan.py liquids [MANIFEST]                    liquid parameter report
+    python verkotan.py conducted [LOG ...]                   maximum conducted powers of lteresults_cal.txt logs
+Commands that only compute and print JSON, no files are written:
+    python verkotan.py evaluate EXPORT ...                   zoom scan verdicts
+    python verkotan.py maximums LOG ...                      maximum conducted powers per band
+    python verkotan.py interpolate WORKBOOK FREQUENCY ...    liquid parameters at frequencies
+Analysis server for the lab, see job_server.py:
+    python verkotan.py serve [--host HOST] [--port PORT]
+
+The library functions evaluate_sar, conducted_maximums, band_frequencies and liquid_parameters take file names
+or open files (e.g. io.StringIO / io.BytesIO) and return plain dicts and lists, so many jobs can be run in one
+Python process. sar_report, conducted_report and liquid_report write those results as the Word tables of the tools.
+"""
+
+TOOLS = {   # command: (package, module)
+    'sar': ("SAR_ZoomScan", "SARzoom"),
+    'liquids': ("Liquids", "liquids"),
+    'conducted': ("ConductedMax", "conductedmax"),
+}
+
+
+def load_module(package, module):
+    """Imports a module of a tool package"""
+
+    return importlib.import_module(f"{package}.{module}")
+
+
+def load_tool(command):
+    """Imports the script module of a tool"""
+
+    return load_module(*TOOLS[command])
+
+
+def _plain(value):
+    """Converts numpy values to Python values and NaN to None, so results can be written as JSON"""
+
+    if hasattr(value, "tolist"):
+        value = value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [_plain(item) for item in value]
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def evaluate_sar(export, allowed_step_sizes=None, surface_distance=0.0):
+    """Evaluates one SEMCAD zoom scan export, given as a file name or an open text file. Returns a dict with
+    the verdict ("Pass", "Fail" or "Error") and the values behind it, see zoomscan.evaluate_summary, and the
+    peak 1 g / 10 g averages of volume_average.peak_averages unless surface_distance is None.
+    allowed_step_sizes defaults to zoomscan.ALLOWED_STEP_SIZES. Raises IndexError if the export has no headers"""
+
+    zoomscan = load_module("SAR_ZoomScan", "zoomscan")
+    if allowed_step_sizes is None:
+        allowed_step_sizes = zoomscan.ALLOWED_STEP_SIZES
+    if hasattr(export, "read"):
+        results = zoomscan.evaluate_stream(export, allowed_step_sizes, surface_distance)
+    else:
+        results = zoomscan.evaluate_file(export, allowed_step_sizes, surface_distance=surface_distance)
+    return {key: _plain(value) for key, value in results.items()}
+
+
+def conducted_maximums(logs):
+    """Maximum conducted powers of lteresults_cal.txt logs (file names or open text files), results of several
+    logs are merged. Returns {band: [rows]} where each row is a dict of the value columns of conductedmax.py.
+    Raises ValueError if a log has an unknown channel type"""
+
+    conductedmax = load_tool('conducted')
+    max_powers = conductedmax.find_max_powers(logs)
+    return {band: [dict(zip(conductedmax.value_columns, (_plain(value) for value in row))) for row in rows]
+            for band, rows in max_powers.items()}
+
+
+def band_frequencies(frequency_table, bands):
+    """Frequencies of the given band columns of a frequency table workbook (file name or open binary file),
+    in the order of bands. Tables given by file name are parsed once per process, see frequency_table.py.
+    Raises ValueError on unknown bands"""
+
+    tables = load_module("Liquids", "frequency_table")
+    if hasattr(frequency_table, "read"):
+        table = tables.read_table(frequency_table)
+    else:
+        table = tables.load_table(frequency_table)
+    unknown = tables.unknown_columns(table, bands)
+    if unknown:
+        raise ValueError(f"unknown columns {', '.join(unknown)}")
+    frequencies = []
+    for band in bands:
+        frequencies.extend(table[band])
+    return frequencies
+
+
+def liquid_parameters(liquid_workbook, frequencies):
+    """Targets, measured values and deltas of a liquid measurement workbook (file name or open binary file) at
+    the given frequencies, the values of the Search sheet of liquids.py. Returns a list of dicts with 'freq'
+    and the keys of liquid_params.SEARCH_COLUMNS. Raises ValueError listing the frequencies outside the
+    measured range"""
+
+    import openpyxl as xl
+    liquid_params = load_module("Liquids", "liquid_params")
+    wb = xl.load_workbook(liquid_workbook, read_only=True)
+    try:
+        frequency_index = liquid_params.FrequencyIndex(liquid_params.read_liquid(wb.active))
+    finally:
+        wb.close()
+    missing = frequency_index.out_of_range(frequencies)
+    if missing:
+        raise ValueError(f"frequencies {', '.join(f'{frequency:g}' for frequency in missing)} out of scope")
+    keys = ['freq'] + list(liquid_params.SEARCH_COLUMNS)
+    return [dict(zip(keys, row)) for row in frequency_index.interpolate(frequencies).tolist()]
+
+
+def _number(value):
+    """Converts None of a JSON result back to NaN"""
+
+    return float('nan') if value is None else value
+
+
+def sar_report(results, output):
+    """Writes the Report.docx table of SARzoom.py for a list of evaluate_sar results (also after a round trip
+    through JSON) to output, a file name or an open binary file"""
+
+    import report_table
+    sarzoom = load_tool('sar')
+    result_table = load_module("SAR_ZoomScan", "result_table")
+    document, table = sarzoom.new_report()
+    records = [result_table.ScanResult.from_results(None, {key: _number(value) for key, value in result.items()})
+               for result in results]
+    report_table.add_rows(table, [sarzoom.report_row(record) for record in records])
+    document.save(output)
+
+
+def conducted_report(maximums, output):
+    """Writes the table of conductedmax.py for the result of conducted_maximums to output, a file name or an
+    open binary file"""
+
+    conductedmax = load_tool('conducted')
+    max_powers = {band: [[row[column] for column in conductedmax.value_columns] for row in rows]
+                  for band, rows in maximums.items()}
+    conductedmax.new_doc(max_powers).save(output)
+
+
+def liquid_report(parameters, output):
+    """Writes the Report.docx table of liquids.py for the result of liquid_parameters to output, a file name or an
+    open binary file. Rows are dated today"""
+
+    import report_table
+    from datetime import datetime
+    liquids = load_tool('liquids')
+    liquid_params = load_module("Liquids", "liquid_params")
+    date_now = datetime.today().strftime('%d.%m.%Y')
+    document, table = liquids.new_document()
+    rows = [liquids.table_row(date_now, row['freq'], [row[key] for key in liquid_params.SEARCH_COLUMNS])
+            for row in parameters]
+    report_table.add_rows(table, rows, liquids.body_style)
+    document.save(output)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="verkotan", description="SAR lab tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    sar = commands.add_parser("sar", help="evaluate SEMCAD zoom scan exports in the current folder")
+    sar.add_argument("--watch", nargs="?", const=".", metavar="INBOX",
+                     help="keep running and handle new exports in INBOX (default: current folder)")
+    sar.add_argument("--no-excel", action="store_true", help="do not write the audit workbook")
+    sar.add_argument("--excel", help="name of the audit workbook (default: results.xlsx)")
+    sar.add_argument("--report", help="name of the word report (default: Report.docx)")
+    liquids = commands.add_parser("liquids", help="liquid parameter report of the excel files in the current folder")
+    liquids.add_argument("manifest", nargs="?", help="JSON or CSV file with the columns of each excel file")
+    liquids.add_argument("--frequency-table", help='frequency table workbook (default: "frequency table.xlsx")')
+    liquids.add_argument("--report", help="name of the word report (default: Report.docx)")
+    conducted = commands.add_parser("conducted", help="maximum conducted powers per band and channel type")
+    conducted.add_argument("logs", nargs="*", help="lteresults_cal.txt files, results are merged")
+    conducted.add_argument("--report", help='name of the word report (default: "conducted maximums.docx")')
+
+    evaluate = commands.add_parser("evaluate", help="print zoom scan verdicts of exports as JSON")
+    evaluate.add_argument("exports", nargs="+")
+    evaluate.add_argument("--surface-distance", type=float, default=0.0,
+                          help="m from the phantom surface to the lowest layer for the 1 g / 10 g averages")
+    maximums = commands.add_parser("maximums", help="print maximum conducted powers of logs as JSON")
+    maximums.add_argument("logs", nargs="+")
+    interpolate = commands.add_parser("interpolate", help="print liquid parameters at frequencies as JSON")
+    interpolate.add_argument("workbook")
+    interpolate.add_argument("frequencies", nargs="*", type=float)
+    interpolate.add_argument("--bands", nargs="+", help="take the frequencies from these frequency table columns")
+    interpolate.add_argument("--frequency-table", default="frequency table.xlsx")
+
+    serve = commands.add_parser("serve", help="run the analysis server, see job_server.py")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8080)
+    serve.add_argument("--workers", type=int, help="worker processes (default: sum of the job type limits)")
+    serve.add_argument("--frequency-table", default="frequency table.xlsx",
+                       help="frequency table used for the bands= of liquid jobs")
+    return parser.parse_args(argv)
+
+
+def run_tool(args):
+    tool = load_tool(args.command)
+    if getattr(args, 'report', None):
+        tool.doc_name = args.report
+    if args.command == "sar":
+        if args.excel:
+            tool.excel_file_name = args.excel
+        if args.no_excel:
+            tool.create_audit_excel = False
+        tool.main(["--watch", os.path.abspath(args.watch)] if args.watch else [], pause=False)
+    elif args.command == "liquids":
+        if args.frequency_table:
+            tool.frequencies_excel = args.frequency_table
+        tool.main(args.manifest)
+    elif args.command == "conducted":
+        tool.main(args.logs)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.command in TOOLS:
+        run_tool(args)
+        return
+    if args.command == "serve":
+        import job_server
+        job_server.main(args.host, args.port, args.workers, args.frequency_table)
+        return
+    try:
+        if args.command == "evaluate":
+            output = {export: evaluate_sar(export, surface_distance=args.surface_distance) for export in args.exports}
+        elif args.command == "maximums":
+            output = conducted_maximums(args.logs)
+        else:
+            frequencies = list(args.frequencies)
+            if args.bands:
+                frequencies += band_frequencies(args.frequency_table, args.bands)
+            output = liquid_parameters(args.workbook, frequencies)
+    except (OSError, IndexError, ValueError) as error:
+        print(f"ERROR: {error}", file=sys.stderr)
+        sys.exit(1)
+    json.dump(output, sys.stdout, indent=2)
+    print()
+
+
+if __name__ == "__main__":
+    main()